@@ -0,0 +1,257 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+from time import perf_counter
+
+from pydub.generators import Sine
+
+from src.cache import AudioCache
+from src.loader import load_json, load_task
+from src.text.TextFileGenerator import TranscriptFileGenerator
+
+PHASES = ['load', 'select', 'execute', 'finalise', 'transcript', 'export']
+
+
+def synthesise_task(directory, args):
+    """
+    Creates a task file and its (WAV) clips in the given directory
+    :return: Location of the task file
+    """
+    generator = random.Random(args.seed)
+    segments = []
+    for index in range(args.segments):
+        clip_name = f'clip_{index}.wav'
+        length = generator.randint(args.min_clip_length, args.max_clip_length)
+        clip = Sine(200 + 10 * index, sample_rate=args.frame_rate).to_audio_segment(length, volume=-20)
+        clip.export(os.path.join(directory, clip_name), format='wav')
+        segments.append({
+            'id': f'segment_{index}',
+            'text': f'segment {index}',
+            'audio': clip_name,
+            'always': {
+                'weight': generator.uniform(1, args.max_weight),
+                'cool_down': generator.randint(0, args.max_cool_down)
+            },
+            'sections': [],
+            'timestamps': []
+        })
+    for _ in range(args.sections):
+        start = generator.random()
+        end = min(1.0, start + generator.random() * 0.2)
+        generator.choice(segments)['sections'].append({
+            'weight': generator.uniform(1, args.max_weight),
+            'cool_down': generator.randint(0, args.max_cool_down),
+            'start': {'percentage': start},
+            'end': {'percentage': end}
+        })
+    for _ in range(args.timestamps):
+        generator.choice(segments)['timestamps'].append({'percentage': generator.random()})
+
+    overlay = Sine(50, sample_rate=args.frame_rate).to_audio_segment(5000, volume=-30)
+    overlay.export(os.path.join(directory, 'overlay.wav'), format='wav')
+    task_file = {
+        'settings': {
+            'seed': args.seed,
+            'breath_pause_length': 300
+        },
+        'effects': [
+            {'type': 'post_volume_gain', 'gain': -3},
+            {'type': 'overlay', 'audio': 'overlay.wav', 'gain': -6}
+        ],
+        'segments': segments
+    }
+    task_file_path = os.path.join(directory, 'task.json')
+    with open(task_file_path, 'w') as handle:
+        handle.write(json.dumps(task_file))
+    return task_file_path
+
+
+def measure(task_file_path, directory, duration):
+    """
+    Times each phase of generating an output of the given duration (in seconds)
+    """
+    timings = {}
+
+    start = perf_counter()
+    task = load_task(load_json(task_file_path), directory, duration, None, AudioCache())
+    timings['load'] = perf_counter() - start
+    task.logger.enabled = False
+
+    # Time the selection separately from the rest of the planning
+    selector = task.segment_selector
+    get_segment = selector.get_segment
+    selection = {'time': 0.0, 'calls': 0}
+
+    def timed_get_segment(result):
+        call_start = perf_counter()
+        segment = get_segment(result)
+        selection['time'] += perf_counter() - call_start
+        selection['calls'] += 1
+        return segment
+
+    selector.get_segment = timed_get_segment
+
+    start = perf_counter()
+    task.plan()
+    plan_time = perf_counter() - start
+    start = perf_counter()
+    task.finalise()
+    timings['finalise'] = perf_counter() - start
+    timings['execute'] = plan_time + timings['finalise']
+    timings['select'] = selection['time']
+    timings['picks'] = selection['calls']
+
+    start = perf_counter()
+    TranscriptFileGenerator(task.result, {}).compile()
+    timings['transcript'] = perf_counter() - start
+
+    start = perf_counter()
+    output_path = os.path.join(directory, 'output.wav')
+    task.result.audio.export(output_path, format='wav')
+    timings['export'] = perf_counter() - start
+    os.remove(output_path)
+    return timings
+
+
+def compare(results, baseline, tolerance, min_difference=0.005):
+    """
+    Prints the ratio of each timing to the baseline. Phases that only take a few milliseconds
+    are dominated by timer noise, so a phase only counts as a regression if it is slower by more
+    than the tolerance and by more than `min_difference` seconds.
+    :return: True if any phase is slower than the baseline by more than the tolerance
+    """
+    baseline_results = {entry['duration']: entry for entry in baseline['results']}
+    regression = False
+    for entry in results:
+        reference = baseline_results.get(entry['duration'])
+        if reference is None:
+            continue
+        for phase in PHASES:
+            if reference[phase] <= 0:
+                continue
+            ratio = entry[phase] / reference[phase]
+            marker = ''
+            if ratio > tolerance and entry[phase] - reference[phase] > min_difference:
+                marker = ' <- regression'
+                regression = True
+            print(f'{entry["duration"]:>7}s {phase:<10} {ratio:6.2f}x{marker}')
+    return regression
+
+
+def run(args):
+    durations = [int(duration) for duration in args.durations.split(',')]
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        print('Synthesising task...')
+        task_file_path = synthesise_task(directory, args)
+        for duration in durations:
+            print(f'Measuring an output of {duration}s...')
+            timings = measure(task_file_path, directory, duration)
+            timings['duration'] = duration
+            results.append(timings)
+            print('  ' + ', '.join(f'{phase}: {timings[phase]:.3f}s' for phase in PHASES))
+
+    report = {
+        'config': {key: value for key, value in vars(args).items() if key not in ['output', 'baseline']},
+        'results': results
+    }
+    with open(args.output, 'w') as handle:
+        handle.write(json.dumps(report, indent=2))
+    print(f'Results written to \'{args.output}\'')
+
+    if args.baseline is not None:
+        if compare(results, load_json(args.baseline), args.tolerance, args.min_difference / 1000):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Measures the performance of each phase on synthesised task files',
+        add_help=True
+    )
+    parser.add_argument(
+        '-o', '--output',
+        help='Location of the results file',
+        default='benchmark.json'
+    )
+    parser.add_argument(
+        '-b', '--baseline',
+        help='Results file to compare the results against'
+    )
+    parser.add_argument(
+        '--tolerance',
+        help='Ratio to the baseline above which a phase counts as a regression',
+        type=float,
+        default=1.25
+    )
+    parser.add_argument(
+        '--min-difference',
+        help='Time (in milliseconds) by which a phase has to be slower than the baseline, as well as by the '
+             'tolerance, to count as a regression. Keeps timer noise of very short phases from counting',
+        type=float,
+        default=5
+    )
+    parser.add_argument(
+        '--durations',
+        help='Comma separated durations (in seconds) of the measured outputs',
+        default='60,600,3600,36000'
+    )
+    parser.add_argument(
+        '--segments',
+        help='Number of segments',
+        type=int,
+        default=100
+    )
+    parser.add_argument(
+        '--sections',
+        help='Number of sections',
+        type=int,
+        default=50
+    )
+    parser.add_argument(
+        '--timestamps',
+        help='Number of forced timestamps',
+        type=int,
+        default=20
+    )
+    parser.add_argument(
+        '--max-weight',
+        help='Maximum weight of a segment',
+        type=float,
+        default=10
+    )
+    parser.add_argument(
+        '--max-cool-down',
+        help='Maximum cool down of a segment',
+        type=int,
+        default=5
+    )
+    parser.add_argument(
+        '--min-clip-length',
+        help='Minimum clip length in milliseconds',
+        type=int,
+        default=500
+    )
+    parser.add_argument(
+        '--max-clip-length',
+        help='Maximum clip length in milliseconds',
+        type=int,
+        default=3000
+    )
+    parser.add_argument(
+        '--frame-rate',
+        help='Frame rate of the clips',
+        type=int,
+        default=8000
+    )
+    parser.add_argument(
+        '--seed',
+        help='Seed of the synthesised task',
+        type=int,
+        default=1
+    )
+
+    run(parser.parse_args())
@@ -0,0 +1,37 @@
+import argparse
+
+from src.bundle import write_bundle
+from src.cache import AudioCache
+from src.loader import add_cache_arguments, get_cache_directory, load_json
+
+
+def run(args):
+    cache_directory = get_cache_directory(args)
+    audio_cache = AudioCache(cache_directory)
+    print('Compiling...')
+    write_bundle(args.output, load_json(args.task), args.audio_base_directory, audio_cache, int(args.jobs))
+    print(f'Task compiled to \'{args.output}\'.')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Compiles a task file and its audio files into a single bundle, which generate.py can run '
+                    'from without decoding any audio',
+        add_help=True
+    )
+    parser.add_argument(
+        'task',
+        help='Location of the task file'
+    )
+    parser.add_argument(
+        'audio_base_directory',
+        help='Path to the directory where the audio files are located'
+    )
+    parser.add_argument(
+        '-o', '--output',
+        help='Location of the created bundle',
+        default='task.hippo'
+    )
+    add_cache_arguments(parser, 'Number of worker processes used to decode the audio files')
+
+    run(parser.parse_args())
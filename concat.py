@@ -0,0 +1,28 @@
+import argparse
+
+from src.concat import concat_files
+
+
+def run(args):
+    print(f'Joining {len(args.slices)} slices...')
+    concat_files(args.slices, args.output)
+    print(f'Slices joined to \'{args.output}\'.')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Joins slices rendered by render.py into a single audio file, without encoding them again',
+        add_help=True
+    )
+    parser.add_argument(
+        'slices',
+        help='Locations of the slices, in order',
+        nargs='+'
+    )
+    parser.add_argument(
+        '-o', '--output',
+        help='Location of the joined file, of the same type as the slices (wav, pcm or mp3)',
+        required=True
+    )
+
+    run(parser.parse_args())
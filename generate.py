@@ -1,133 +1,222 @@
-import json
+import os
+import tempfile
+from functools import partial
 
 import argparse
 
-from pydub import AudioSegment
-
-from src.effect import OverlayEffect, PostVolumeGainEffect
-from src.segment import Segment
-from src.settings import Settings
-from src.task import Task
+from src.batch import parse_seeds, run_variants
+from src.bundle import BUNDLE_FOLDER, Bundle, is_bundle
+from src.cache import AudioCache
+from src.chunks import ChunkCache
+from src.loader import add_cache_arguments, get_cache_directory, load_json, load_task
+from src.manifest import write_manifest
+from src.metrics import Metrics
+from src.render import AudioFormat
+from src.sinks import SINKS, ParallelMp3Sink
+from src.spill import SpillFile
 from src.text.TextFileGenerator import TranscriptFileGenerator
-from src.util import extract
-from src.visualisations.Visualiser import Visualiser
 
 
-class SegmentGenerator:
-    def __init__(self, length):
-        self.length = length
+def generate(task, args):
+    if args.preview:
+        task.plan_preview()
+    else:
+        task.plan()
+    # When streaming, the audio is rendered while it is exported
+    if not args.stream and not args.plan_only:
+        task.finalise(int(args.render_jobs))
 
-    def generate_breath_pause(self):
-        return Segment('silent', '', '', AudioSegment.silent(self.length), None, [], [])
 
+def get_sink_type(sink, encode_jobs, chunk_cache=None):
+    """
+    MP3 files are encoded in chunks by several encoders at a time if more than one job is given
+    """
+    if sink == 'mp3' and encode_jobs > 1:
+        return partial(ParallelMp3Sink, jobs=encode_jobs, chunk_cache=chunk_cache)
+    return SINKS[sink]
 
-def load_json(file_name):
-    with open(file_name, 'r') as handle:
-        raw = handle.read()
-        return json.loads(raw)
 
+def export(task, output_name, args):
+    no_text_file = args.no_text
+    stream = args.stream
+    sink = args.sink
+    encode_jobs = int(args.encode_jobs)
 
-def load_segments(task_file, audio_folder, max_time):
-    segments = []
-    for segment_json in task_file["segments"]:
-        segments.append(Segment.from_json(segment_json, audio_folder, max_time))
-    return segments
+    # Transcript export
+    if not no_text_file:
+        meta = {}
+        try:
+            meta = load_json('meta.json')
+        except Exception:
+            print('No meta.json file found in working directory')
+        with task.metrics.phase('transcript'):
+            generator = TranscriptFileGenerator(task.result, meta)
+            with open(f'{output_name}.txt', 'w') as handle:
+                print(f'Exporting transcript to \'{output_name}.txt\'...')
+                generator.write(handle)
 
+    if args.manifest:
+        print(f'Exporting plan manifest to \'{output_name}.manifest.json\'...')
+        audio_folder = BUNDLE_FOLDER if args.audio_base_directory is None else args.audio_base_directory
+        write_manifest(output_name + '.manifest.json', task, audio_folder)
 
-def load_settings(task_file, arg_duration, arg_seed):
-    settings = task_file['settings']
-    if arg_seed is None and 'seed' not in settings:
-        seed = None
+    # Audio export
+    if args.plan_only:
+        print('Only the plan was made, no audio is exported.')
+    elif stream:
+        print(f'Streaming file to \'{output_name}.{sink}\'...')
+        task.stream(get_sink_type(sink, encode_jobs, task.chunk_cache), f'{output_name}.{sink}')
+    elif encode_jobs > 1 or isinstance(task.result.storage, SpillFile):
+        print(f'Exporting file to \'{output_name}.mp3\' with {encode_jobs} encoder(s)...')
+        with task.metrics.phase('encode'):
+            audio = task.result.audio
+            audio_format = AudioFormat(audio.frame_rate, audio.channels, audio.sample_width)
+            sink_type = get_sink_type('mp3', encode_jobs, task.chunk_cache)
+            mp3_sink = sink_type(output_name + '.mp3', audio_format)
+            # Spilled output is read back chunk by chunk, such that it is never all in memory at once
+            if isinstance(task.result.storage, SpillFile):
+                chunks = task.result.storage.read_chunks()
+            else:
+                chunks = [audio_format.to_samples(audio)]
+            try:
+                for chunk in chunks:
+                    mp3_sink.write(chunk)
+            finally:
+                mp3_sink.close()
     else:
-        seed = int(arg_seed) if arg_seed is not None else settings['seed']
+        print(f'Exporting file to \'{output_name}.mp3\'...')
+        with task.metrics.phase('encode'):
+            task.result.audio.export(output_name + '.mp3')
+    print('Export complete.')
 
-    if arg_duration is None and 'duration' not in settings:
-        print('No duration specified, using the default of 30 seconds')
-        duration = 30
-    else:
-        duration = int(arg_duration) if arg_duration is not None else settings['duration']
+    if args.heatmap is not None:
+        print(f'Exporting heatmap to \'{output_name}.{args.heatmap}\'...')
+        # Importing the Visualiser imports matplotlib, which is slow, so only done when it is used
+        from src.visualisations.Visualiser import Visualiser
+        Visualiser(task.result).save_density(f'{output_name}.{args.heatmap}', int(args.heatmap_buckets))
 
-    breath_pause_length = settings['breath_pause_length']
-    return Settings(seed, duration, breath_pause_length)
+    if args.timeline:
+        print(f'Exporting timeline to \'{output_name}.npz\'...')
+        task.result.timeline.export(output_name + '.npz')
 
+    if args.metrics is not None:
+        task.metrics.export(get_metrics_path(args.metrics, output_name, args))
 
-def load_effects(task_file, audio_folder):
-    effects = []
-    for effect_json in extract('effects', task_file, []):
-        effect_type = extract('type', effect_json, 'none')
-        if effect_type == 'overlay':
-            effects.append(OverlayEffect.from_json(effect_json, audio_folder))
-        elif effect_type == 'post_volume_gain':
-            effects.append(PostVolumeGainEffect.from_json(effect_json))
-        else:
-            print(f'unknown effect {effect_type}')
-    return effects
 
+def get_metrics_path(metrics_path, output_name, args):
+    """
+    Variants each get their own metrics file, suffixed like their output
+    """
+    if args.seeds is None:
+        return metrics_path
+    root, extension = os.path.splitext(metrics_path)
+    suffix = output_name[len(args.output):]
+    return root + suffix + extension
 
-def load_task(task_file, audio_folder, arg_duration, arg_seed):
-    settings = load_settings(task_file, arg_duration, arg_seed)
-    segments = load_segments(task_file, audio_folder, settings.duration)
-    segment_generator = SegmentGenerator(settings.breath_pause_length)
-    effects = load_effects(task_file, audio_folder)
-    return Task(segments, settings, segment_generator, effects)
 
+def generate_variant(task, output_name, args):
+    generate(task, args)
+    print(f'{output_name}: {task.result.stats.histogram}')
+    export(task, output_name, args)
 
-def run(args):
-    task_file_path = args.task
+
+def configure_rendering(task, args, cache_directory):
+    """
+    Applies the command line options that change how (but not what) the task renders
+    """
+    if args.max_memory is not None:
+        task.max_memory = int(args.max_memory) * 1024 * 1024
+    if args.incremental:
+        if cache_directory is None:
+            raise ValueError('Incremental rendering needs a cache directory')
+        task.chunk_cache = ChunkCache(os.path.join(cache_directory, 'chunks'))
+
+
+def open_task(args, jobs=1, metrics=None):
+    """
+    Loads the task of the command line arguments, from a task file and its audio folder or from
+    a task bundle, and configures how it renders
+    :param args: Command line arguments
+    :param int jobs: Number of worker processes used to decode the audio files
+    :param Metrics metrics:
+    :rtype: Task
+    """
     audio_folder = args.audio_base_directory
+    cache_directory = get_cache_directory(args)
+    if metrics is None:
+        metrics = Metrics()
+    if is_bundle(args.task):
+        # A compiled task brings its own (already decoded) audio
+        with metrics.phase('load'):
+            audio_cache = Bundle(args.task)
+        task_file = audio_cache.task_file
+        audio_folder = BUNDLE_FOLDER
+    else:
+        if audio_folder is None:
+            raise ValueError('The audio base directory is required, unless the task is a compiled bundle')
+        max_cache_size = None if args.max_cache_size is None else int(args.max_cache_size) * 1024 * 1024
+        audio_cache = AudioCache(cache_directory, args.lazy, max_cache_size)
+        with metrics.phase('load'):
+            task_file = load_json(args.task)
+    task = load_task(task_file, audio_folder, args.duration, args.seed, audio_cache, jobs, metrics)
+    configure_rendering(task, args, cache_directory)
+    return task
+
+
+def run(args):
+    if args.seeds is not None and args.no_cache and int(args.jobs) > 1 and not args.incremental:
+        # Without a cache every worker would decode the audio again, so the variants share a
+        # temporary one, which is deleted afterwards
+        with tempfile.TemporaryDirectory() as cache_directory:
+            run(argparse.Namespace(**dict(vars(args), no_cache=False, cache_directory=cache_directory)))
+        return
+
     output_name = args.output
-    arg_duration = args.duration
-    arg_seed = args.seed
     show_visualisation = args.visualise
-    generate_preview = args.preview
-    no_text_file = args.no_text
+    jobs = int(args.jobs)
 
     print('Initialising...')
-    task = load_task(load_json(task_file_path), audio_folder, arg_duration, arg_seed)
+    metrics = Metrics()
+    task = open_task(args, jobs, metrics)
     print('Initialisation complete.')
-    if generate_preview:
-        task.preview()
-    else:
-        task.execute()
+
+    if args.seeds is not None:
+        if show_visualisation:
+            print('Visualisations are not shown when generating variants')
+        # Worker processes load the task again, from the audio that was cached by this load
+        load = partial(open_task, args)
+        run_variants(task, load, parse_seeds(args.seeds), output_name, generate_variant, args, jobs)
+        # The metrics of the variants are exported per variant, these are of loading the task
+        if args.metrics is not None:
+            metrics.export(args.metrics)
+        return
+
+    generate(task, args)
 
     if show_visualisation:
+        from src.visualisations.Visualiser import Visualiser
         visualiser = Visualiser(task.result)
         visualiser.show_visualisation()
 
     # Simple visualisation
     print(task.result.stats.histogram)
 
-    # Transcript export
-    if not no_text_file:
-        meta = {}
-        try:
-            meta = load_json('meta.json')
-        except Exception:
-            print('No meta.json file found in working directory')
-        generator = TranscriptFileGenerator(task.result, meta)
-        text = generator.compile()
-        with open(f'{output_name}.txt', 'w') as handle:
-            print(f'Exporting transcript to \'{output_name}.txt\'...')
-            handle.write(text)
-
-    # Audio export
-    print(f'Exporting file to \'{output_name}.mp3\'...')
-    task.result.audio.export(output_name + '.mp3')
-    print('Export complete.')
+    export(task, output_name, args)
 
 
-if __name__ == '__main__':
+def create_parser():
     parser = argparse.ArgumentParser(
         description='Command line utility tool to generate controlled random speech audio and text samples',
         add_help=True
     )
     parser.add_argument(
         'task',
-        help='Location of the task file'
+        help='Location of the task file, or of a task bundle created with compile.py'
     )
     parser.add_argument(
         'audio_base_directory',
-        help='Path to the directory where the audio files are located'
+        help='Path to the directory where the audio files are located. Not needed for task bundles',
+        nargs='?'
     )
     parser.add_argument(
         '-o', '--output',
@@ -165,4 +254,105 @@ if __name__ == '__main__':
         default=False
     )
 
-    run(parser.parse_args())
+    add_cache_arguments(parser, 'Number of worker processes used to decode the audio files and to generate variants')
+    parser.add_argument(
+        '--stream',
+        help='With this flag enabled, the audio is rendered and exported in chunks, such that memory '
+             'usage does not grow with the duration',
+        action='store_const',
+        const=True,
+        default=False
+    )
+    parser.add_argument(
+        '--sink',
+        help='File format of the streamed audio file. Only mp3 and flac files are compressed',
+        choices=list(SINKS.keys()),
+        default='mp3'
+    )
+    parser.add_argument(
+        '--render-jobs',
+        help='Number of worker processes that render the output, each a part of it. The output is the same '
+             'for any number. Not used with --stream',
+        default=1
+    )
+    parser.add_argument(
+        '--encode-jobs',
+        help='Number of MP3 encoders that run at a time. With more than one, the audio is encoded in chunks '
+             'of about 26 seconds which are joined seamlessly afterwards',
+        default=1
+    )
+    parser.add_argument(
+        '--incremental',
+        help='With this flag enabled, rendered chunks of the output (and MP3 chunks encoded with --encode-jobs) '
+             'are stored in the cache directory, such that later runs only render the chunks that changed',
+        action='store_const',
+        const=True,
+        default=False
+    )
+    parser.add_argument(
+        '--seeds',
+        help='Generates a variant of the task for each of the given seeds, either as a range (e.g. 1..500), '
+             'a comma separated list or a file with one seed per line. The outputs are numbered by seed'
+    )
+    parser.add_argument(
+        '--metrics',
+        help='Location of a JSON file to which the time spent in each phase and other metrics are written'
+    )
+    parser.add_argument(
+        '--timeline',
+        help='With this flag enabled, the timeline (which segment starts when) is exported to a .npz file',
+        action='store_const',
+        const=True,
+        default=False
+    )
+    parser.add_argument(
+        '--manifest',
+        help='With this flag enabled, the plan (which clip starts when, and the effects) is exported to a '
+             '.manifest.json file, which render.py can render on another machine',
+        action='store_const',
+        const=True,
+        default=False
+    )
+    parser.add_argument(
+        '--plan-only',
+        help='With this flag enabled, only the plan is made and no audio is rendered or exported',
+        action='store_const',
+        const=True,
+        default=False
+    )
+    parser.add_argument(
+        '--heatmap',
+        help='Writes a heatmap of the picks of each segment over time to an image file, which does not '
+             'need a display. The format is png by default',
+        nargs='?',
+        const='png',
+        choices=['png', 'svg']
+    )
+    parser.add_argument(
+        '--heatmap-buckets',
+        help='Number of time buckets of the heatmap',
+        default=500
+    )
+    parser.add_argument(
+        '--lazy',
+        help='With this flag enabled, audio files of segments are only decoded when they are used. Their '
+             'durations are read from WAV headers or with ffprobe instead, and the decoded audio is trimmed or '
+             'padded to them',
+        action='store_const',
+        const=True,
+        default=False
+    )
+    parser.add_argument(
+        '--max-memory',
+        help='Memory budget (in MB) for rendering. If the output would not fit, it is rendered into a temporary '
+             'file instead, of which only the part that is being worked on is held in memory'
+    )
+    parser.add_argument(
+        '--max-cache-size',
+        help='Maximum size (in MB) of the decoded audio that is held in memory'
+    )
+    return parser
+
+
+if __name__ == '__main__':
+    run(create_parser().parse_args())
@@ -0,0 +1,136 @@
+import argparse
+
+import numpy as np
+
+from src.cache import AudioCache
+from src.effect import EffectChain
+from src.loader import add_cache_arguments, get_cache_directory, load_effects
+from src.manifest import load_timeline, read_manifest, verify_clips
+from src.render import AudioFormat, Renderer
+from src.sinks import MP3_CONTEXT_FRAMES, MP3_FRAME_LENGTH, SINKS, ParallelMp3Sink
+
+
+def get_range(renderer, args):
+    """
+    :return: The first frame and the frame after the last one to render
+    :rtype: tuple
+    """
+    total = renderer.total_frames
+    if args.slice is not None:
+        # Slices start at a multiple of the MP3 frame length, such that MP3 slices can be joined
+        index, count = [int(part) for part in args.slice.split('/')]
+        if not 0 <= index < count:
+            raise ValueError(f'Slice {args.slice} does not exist')
+        bounds = [total * i // count // MP3_FRAME_LENGTH * MP3_FRAME_LENGTH for i in range(count)] + [total]
+        return bounds[index], bounds[index + 1]
+    start = 0 if args.start is None else int(args.start)
+    end = total if args.end is None else min(int(args.end), total)
+    if args.sink == 'mp3' and (start % MP3_FRAME_LENGTH != 0 or (end != total and end % MP3_FRAME_LENGTH != 0)):
+        raise ValueError(f'MP3 slices have to start and end at a multiple of {MP3_FRAME_LENGTH} frames to be joined')
+    return start, end
+
+
+def render_range(renderer, effect_chain, start, end):
+    """
+    :return: The samples from frame `start` up to `end`, with the effects applied
+    :rtype: np.ndarray
+    """
+    chunks = []
+    for position in renderer.get_chunk_starts(start, end):
+        chunks.append(effect_chain.apply(renderer.render_chunk(position, end), position))
+    if len(chunks) == 0:
+        return np.zeros((0, renderer.audio_format.channels), dtype=renderer.audio_format.sample_type)
+    return np.concatenate(chunks)
+
+
+def run(args):
+    audio_folder = args.audio_base_directory
+    cache_directory = get_cache_directory(args)
+    jobs = int(args.jobs)
+
+    print('Initialising...')
+    manifest = read_manifest(args.manifest)
+    verify_clips(manifest, audio_folder)
+    audio_format = None if manifest['format'] is None else AudioFormat.from_json(manifest['format'])
+    audio_cache = AudioCache(cache_directory)
+    paths = [audio_folder + '/' + clip['audio'] for clip in manifest['clips']]
+    audio_cache.preload(paths, jobs, audio_format)
+    timeline = load_timeline(manifest, audio_folder, audio_cache, audio_format)
+    effects = load_effects(manifest, audio_folder, audio_cache, audio_format)
+    renderer = Renderer(timeline, audio_format=audio_format)
+    effect_chain = EffectChain(effects, renderer.audio_format)
+    start, end = get_range(renderer, args)
+    print('Initialisation complete.')
+
+    path = f'{args.output}.{args.sink}'
+    print(f'Rendering frames {start} to {end} of {renderer.total_frames} to \'{path}\'...')
+    if args.sink == 'mp3':
+        # A slice is written as bare MP3 frames, which can be joined without encoding them again.
+        # The frames at the edges of the slice are encoded with the samples around it, so they join
+        # seamlessly. The whole output (without either) gets a gapless header instead
+        context = MP3_CONTEXT_FRAMES * MP3_FRAME_LENGTH
+        preroll = None
+        if start > 0:
+            preroll = render_range(renderer, effect_chain, max(0, start - context), start)
+        postroll = None
+        if end < renderer.total_frames:
+            postroll = render_range(renderer, effect_chain, end, min(end + context, renderer.total_frames))
+        sink = ParallelMp3Sink(
+            path, renderer.audio_format, int(args.encode_jobs), preroll=preroll, postroll=postroll
+        )
+    else:
+        sink = SINKS[args.sink](path, renderer.audio_format)
+    try:
+        for position in renderer.get_chunk_starts(start, end):
+            samples = renderer.render_chunk(position, end)
+            sink.write(effect_chain.apply(samples, position))
+    finally:
+        sink.close()
+    print('Render complete.')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Renders a plan manifest written by generate.py (or a slice of it) to audio',
+        add_help=True
+    )
+    parser.add_argument(
+        'manifest',
+        help='Location of the manifest'
+    )
+    parser.add_argument(
+        'audio_base_directory',
+        help='Path to the directory where the audio files are located'
+    )
+    parser.add_argument(
+        '-o', '--output',
+        help='The name of the created audio file',
+        default='output'
+    )
+    parser.add_argument(
+        '--sink',
+        help='File format of the created audio file',
+        choices=list(SINKS.keys()),
+        default='wav'
+    )
+    parser.add_argument(
+        '--slice',
+        help='Renders one of a number of equal slices of the output, e.g. 3/8 for the fourth of eight. '
+             'The slices can be joined with concat.py'
+    )
+    parser.add_argument(
+        '--start',
+        help='Frame at which to start rendering'
+    )
+    parser.add_argument(
+        '--end',
+        help='Frame at which to stop rendering'
+    )
+    parser.add_argument(
+        '--encode-jobs',
+        help='Number of MP3 encoders that run at a time',
+        default=1
+    )
+    add_cache_arguments(parser, 'Number of worker processes used to decode the audio files')
+
+    run(parser.parse_args())
@@ -0,0 +1,124 @@
+import argparse
+from functools import partial
+
+from generate import configure_rendering, create_parser, export, generate
+from src.bundle import BUNDLE_FOLDER, Bundle, is_bundle
+from src.daemon import JobRunner, serve
+from src.loader import add_cache_arguments, get_cache_directory, load_json, load_task
+from src.metrics import Metrics
+
+
+def reject_options(message):
+    raise ValueError(message.strip())
+
+
+def parse_options(job):
+    """
+    Parses the options of a job like generate.py would, but raises a ValueError when they are not
+    valid, where argparse would print to the stderr of the server and exit
+    :param dict job:
+    :return: The command line arguments of the job
+    """
+    options = job.get('options', [])
+    if not isinstance(options, list):
+        raise ValueError('The options of a job have to be a list')
+    parser = create_parser()
+    parser.error = reject_options
+    parser.exit = lambda status=0, message=None: reject_options(message or 'Options that exit are not supported')
+    return parser.parse_args(['<job>'] + [str(option) for option in options])
+
+
+def run_job(job, audio_cache, audio_base_directory=None):
+    """
+    Runs a job like generate.py would
+    :param dict job: The task (as JSON or the location of a task file or bundle) and optionally
+                     the audio_base_directory, seed, duration, output and a list of other
+                     command line options of generate.py
+    :param AudioCache audio_cache: Warm cache of the worker
+    :param str audio_base_directory: Audio base directory of jobs that do not specify one
+    :return: The metrics of the job
+    :rtype: dict
+    """
+    args = parse_options(job)
+    args.seed = job.get('seed', args.seed)
+    args.duration = job.get('duration', args.duration)
+    args.output = job.get('output', args.output)
+    audio_folder = job.get('audio_base_directory', audio_base_directory)
+
+    cache_directory = audio_cache.directory
+    metrics = Metrics()
+    task_file = job['task']
+    if isinstance(task_file, str):
+        if is_bundle(task_file):
+            with metrics.phase('load'):
+                audio_cache = Bundle(task_file)
+            task_file = audio_cache.task_file
+            audio_folder = BUNDLE_FOLDER
+        else:
+            with metrics.phase('load'):
+                task_file = load_json(task_file)
+    if audio_folder is None:
+        raise ValueError('The audio base directory is required, unless the task is a compiled bundle')
+    args.audio_base_directory = audio_folder
+    task = load_task(task_file, audio_folder, args.duration, args.seed, audio_cache, 1, metrics)
+    task.logger.enabled = False
+    configure_rendering(task, args, cache_directory)
+    generate(task, args)
+    export(task, args.output, args)
+    return metrics.to_json()
+
+
+def run(args):
+    cache_directory = get_cache_directory(args)
+    max_cache_size = None if args.max_worker_cache_size is None else int(args.max_worker_cache_size) * 1024 * 1024
+    run_job_in_folder = partial(run_job, audio_base_directory=args.audio_base_directory)
+    runner = JobRunner(
+        run_job_in_folder, int(args.jobs), cache_directory, args.lazy, max_cache_size, int(args.history)
+    )
+    print('Starting workers...')
+    runner.warm_up()
+    print(f'Listening on http://{args.host}:{args.port}')
+    serve(runner, args.host, int(args.port), parse_options)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Runs generate.py jobs in a long-running server, which keeps its worker processes and their '
+                    'decoded audio warm between jobs',
+        add_help=True
+    )
+    parser.add_argument(
+        'audio_base_directory',
+        help='Path to the directory where the audio files are located, for jobs that do not specify one',
+        nargs='?'
+    )
+    parser.add_argument(
+        '--host',
+        help='Address to listen on',
+        default='127.0.0.1'
+    )
+    parser.add_argument(
+        '--port',
+        help='Port to listen on',
+        default=8787
+    )
+    add_cache_arguments(parser, 'Number of worker processes, i.e. the number of jobs that run at the same time')
+    parser.add_argument(
+        '--lazy',
+        help='With this flag enabled, audio files of segments are only decoded when they are used',
+        action='store_const',
+        const=True,
+        default=False
+    )
+    parser.add_argument(
+        '--max-worker-cache-size',
+        help='Maximum size (in MB) of the decoded audio that each worker holds in memory. The bound is per worker, '
+             'the cache on disk is not bounded'
+    )
+    parser.add_argument(
+        '--history',
+        help='Number of finished jobs of which the status is kept, after which the oldest are forgotten',
+        default=1000
+    )
+
+    run(parser.parse_args())
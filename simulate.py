@@ -0,0 +1,80 @@
+import argparse
+import json
+from functools import partial
+
+from src.batch import parse_seeds
+from src.bundle import BUNDLE_FOLDER, Bundle, is_bundle
+from src.cache import AudioCache
+from src.loader import add_cache_arguments, get_cache_directory, load_json, load_task
+from src.simulation import format_report, run_simulation
+
+
+def open_task(args, jobs=1):
+    """
+    Loads the task of the command line arguments for simulating it
+    :rtype: Task
+    """
+    audio_folder = args.audio_base_directory
+    if is_bundle(args.task):
+        audio_cache = Bundle(args.task)
+        task_file = audio_cache.task_file
+        audio_folder = BUNDLE_FOLDER
+    else:
+        if audio_folder is None:
+            raise ValueError('The audio base directory is required, unless the task is a compiled bundle')
+        # Only the durations of the clips are needed, which are probed without decoding them
+        audio_cache = AudioCache(get_cache_directory(args), lazy=True)
+        task_file = load_json(args.task)
+    # Effects do not influence the plan, so their audio is not loaded at all
+    task_file = dict(task_file, effects=[])
+    return load_task(task_file, audio_folder, args.duration, None, audio_cache, jobs)
+
+
+def run(args):
+    print('Initialising...')
+    task = open_task(args, int(args.jobs))
+    seeds = parse_seeds(args.seeds)
+    print('Initialisation complete.')
+
+    print(f'Simulating {len(seeds)} seeds...')
+    # Worker processes load the task again, with the durations that this load kept in the cache
+    report = run_simulation(task, partial(open_task, args), seeds, int(args.jobs))
+    print(format_report(report))
+    if args.output is not None:
+        with open(args.output, 'w') as handle:
+            handle.write(json.dumps(report, indent=2))
+        print(f'Report written to \'{args.output}\'.')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Plans a task for many seeds without rendering any audio, and reports how often each segment '
+                    'is picked, how well sections are covered and how late forced timestamps are picked',
+        add_help=True
+    )
+    parser.add_argument(
+        'task',
+        help='Location of the task file, or of a task bundle created with compile.py'
+    )
+    parser.add_argument(
+        'audio_base_directory',
+        help='Path to the directory where the audio files are located. Not needed for task bundles',
+        nargs='?'
+    )
+    parser.add_argument(
+        '--seeds',
+        help='Seeds to simulate, as a range (e.g. 1..500), a comma separated list or a file with one seed per line',
+        default='1..1000'
+    )
+    parser.add_argument(
+        '-d', '--duration',
+        help='Sets (roughly) the duration of the simulated output in seconds. This overrides the value in the '
+             'task file',
+    )
+    parser.add_argument(
+        '-o', '--output',
+        help='Location of a JSON file to which the full report is written'
+    )
+    add_cache_arguments(parser, 'Number of worker processes that simulate seeds')
+
+    run(parser.parse_args())
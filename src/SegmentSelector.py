@@ -1,12 +1,140 @@
-import random
+import heapq
 
-from src.timestamp import Timestamp
+from src.sampling import UniformStream, WeightedSampler, WeightTree
 
 
 class SegmentSelector:
-    def __init__(self, segments):
+    def __init__(self, segments, generator):
+        """
+        The selector precompiles the segments into indices, such that each call to get_segment
+        only has to look at what changed since the previous call. This relies on the time of the
+        result only ever moving forward between calls.
+        :param list segments:
+        :param random.Random generator: Source of the random picks
+        """
         self.segments = segments
 
+        # Forced timestamps that are not due yet, as a min-heap of (seconds, segment index)
+        self.pending_timestamps = []
+        for index, segment in enumerate(segments):
+            for timestamp in segment.timestamps:
+                self.pending_timestamps.append((timestamp.seconds, index))
+        heapq.heapify(self.pending_timestamps)
+        # Forced timestamps that are due, as a min-heap of (segment index, seconds)
+        self.due_timestamps = []
+        # Forced timestamps that have been picked, as (segment index, seconds, seconds at the pick)
+        self.forced_picks = []
+
+        # All section boundaries, ordered by time. A section is active from the moment the time
+        # reaches its start, until the time has passed its end
+        self.section_starts = []
+        self.section_ends = []
+        for index, segment in enumerate(segments):
+            for section_index, section in enumerate(segment.sections):
+                self.section_starts.append((section.start.seconds, index, section_index))
+                self.section_ends.append((section.end.seconds, index, section_index))
+        self.section_starts.sort()
+        self.section_ends.sort()
+        self.next_section_start = 0
+        self.next_section_end = 0
+        self.active_sections = [set() for _ in segments]
+
+        # The number of picks so far and, per segment, the pick at which it was last picked
+        self.picks = 0
+        self.last_picked = [None for _ in segments]
+        # Total relaxation of the cool downs over all picks
+        self.relaxations = 0
+
+        # Weights of the candidates that honour their cool down, by segment index. Candidates
+        # that are cooling down have a weight of 0, until the pick at which their cool down has
+        # passed, which is kept in a min-heap of (pick, segment index)
+        self.weights = WeightTree(len(segments))
+        self.cooling = []
+        self.uniforms = UniformStream(generator)
+
+        # The candidates only change at section boundaries, so they are kept by segment index
+        # and the ordered list is only rebuilt (when it is needed) after a change
+        self.active_candidates = {}
+        for index, segment in enumerate(segments):
+            self.update_candidate(index)
+        self.candidates = None
+
+    def update_candidate(self, index):
+        """
+        Recomputes the candidate entry of a single segment. If the segment has active sections,
+        the first of them (in the order of the task file) takes precedence over the 'always
+        occurrence'
+        """
+        segment = self.segments[index]
+        active_sections = self.active_sections[index]
+        if len(active_sections) > 0:
+            section = segment.sections[min(active_sections)]
+            self.active_candidates[index] = {
+                'index': index,
+                'segment': segment,
+                'weight': section.weight,
+                'cool_down': section.cool_down
+            }
+        elif segment.has_always_occurrence():
+            self.active_candidates[index] = {
+                'index': index,
+                'segment': segment,
+                'weight': segment.always_occurrence.weight,
+                'cool_down': segment.always_occurrence.cool_down
+            }
+        else:
+            self.active_candidates.pop(index, None)
+        self.candidates = None
+        self.schedule(index)
+
+    def schedule(self, index):
+        """
+        Updates the weight of a segment, after it was picked or its candidate entry changed. If
+        it is cooling down, the pick at which its cool down has passed is scheduled.
+        """
+        entry = self.active_candidates.get(index)
+        if entry is None:
+            self.weights.set(index, 0)
+        elif self.get_required_relaxation(index, entry['cool_down']) > 0:
+            self.weights.set(index, 0)
+            heapq.heappush(self.cooling, (self.last_picked[index] + entry['cool_down'] + 1, index))
+        else:
+            self.weights.set(index, entry['weight'])
+
+    def restore_cooled_down(self):
+        """
+        Restores the weights of the segments of which the cool down has passed
+        """
+        while len(self.cooling) > 0 and self.cooling[0][0] <= self.picks:
+            _, index = heapq.heappop(self.cooling)
+            entry = self.active_candidates.get(index)
+            # The segment may have been picked again, or its entry changed, since it was scheduled
+            if entry is not None and self.get_required_relaxation(index, entry['cool_down']) == 0:
+                self.weights.set(index, entry['weight'])
+
+    def advance(self, seconds):
+        """
+        Moves the indices forward to the given time
+        :param float seconds:
+        """
+        while len(self.pending_timestamps) > 0 and self.pending_timestamps[0][0] <= seconds:
+            timestamp, index = heapq.heappop(self.pending_timestamps)
+            heapq.heappush(self.due_timestamps, (index, timestamp))
+
+        while self.next_section_start < len(self.section_starts) \
+                and self.section_starts[self.next_section_start][0] <= seconds:
+            _, index, section_index = self.section_starts[self.next_section_start]
+            self.active_sections[index].add(section_index)
+            self.update_candidate(index)
+            self.next_section_start += 1
+
+        while self.next_section_end < len(self.section_ends) \
+                and self.section_ends[self.next_section_end][0] < seconds:
+            _, index, section_index = self.section_ends[self.next_section_end]
+            self.active_sections[index].discard(section_index)
+            self.update_candidate(index)
+            self.next_section_end += 1
+
     def get_segment(self, result):
         """
         > The meat of the program <
@@ -19,60 +147,78 @@ class SegmentSelector:
           defined, or those segments that have a section that the current timestamp falls into
         :return:
         """
-        current_timestamp = Timestamp(result.get_duration_in_seconds())
+        seconds = result.get_duration_in_seconds()
+        self.advance(seconds)
 
         # First check if there is a segment with a timestamp that is less than the current
         # time. This must automatically become the next segment (if there are multiple,
-        # subsequent calls to this method will retrieve each of them individually)
-        for segment in self.segments:
-            for timestamp in segment.timestamps:
-                if timestamp.is_before(current_timestamp):
-                    # We remove the timestamp to mark it as done and such it will not show
-                    # up in subsequent calls to this method
-                    segment.timestamps.remove(timestamp)
-                    return segment
+        # subsequent calls to this method will retrieve each of them individually, in the
+        # order of the task file)
+        if len(self.due_timestamps) > 0:
+            index, timestamp = heapq.heappop(self.due_timestamps)
+            self.forced_picks.append((index, timestamp, seconds))
+            self.record_pick(index)
+            return self.segments[index]
 
-        # Get a list of candidate segments, i.e. those segments:
+        # The candidate segments are those segments:
         # - That have an 'always occurrence' defined, i.e. they should always be included
         # - That have a section that the current timestamp falls into, i.e. they are
         #   momentarily active.
         # If both statements are true, the section options take precedence over the 'always occurrence'
-        candidates = []
-        for segment in self.segments:
-            section = segment.get_section_by_timestamp(current_timestamp)
-            if section is not None:
-                candidates.append({'segment': segment, 'weight': section.weight, 'cool_down': section.cool_down})
-            elif segment.has_always_occurrence():
-                candidates.append({
-                    'segment': segment,
-                    'weight': segment.always_occurrence.weight,
-                    'cool_down': segment.always_occurrence.cool_down
-                })
-
-        # Filter out segments that do not honour the cool down with relaxation
+        if len(self.active_candidates) == 0:
+            raise ValueError(f'No segment is active at {seconds}s')
+
+        # Usually there are candidates that honour their cool down, of which one is picked
+        # according to their weight
+        self.restore_cooled_down()
+        if self.weights.total > 0:
+            index = self.weights.sample(self.uniforms.next())
+            self.record_pick(index)
+            return self.segments[index]
+
+        # Otherwise, filter out segments that do not honour the cool down with relaxation, i.e.
+        # relax the cool down just enough for at least one candidate to remain
+        if self.candidates is None:
+            self.candidates = [self.active_candidates[index] for index in sorted(self.active_candidates)]
+        candidates = self.candidates
+        relaxations = [self.get_required_relaxation(entry['index'], entry['cool_down']) for entry in candidates]
+        relaxation = min(relaxations)
+        self.relaxations += relaxation
         filtered_candidates = []
-        relaxation = -1
-        while len(filtered_candidates) == 0:
-            filtered_candidates = []
-            relaxation += 1
-            for entry in candidates:
-                segment, cool_down = entry['segment'], entry['cool_down']
-                if self.honours_cool_down(segment, cool_down, relaxation, result):
-                    filtered_candidates.append(entry)
-
-        # Generate distribution, according to their weight
-        distribution = []
-        for entry in filtered_candidates:
-            segment, weight = entry['segment'], entry['weight']
-            distribution.extend([segment for _ in range(weight)])
-
-        # Finally, pick random value from list
-        return random.choice(distribution)
-
-    @staticmethod
-    def honours_cool_down(segment, cool_down, relaxation, result):
-        offset = -cool_down + relaxation
-        if offset >= 0:
-            return True
-        last_added_segments = result.segments[offset:]
-        return segment not in last_added_segments
+        for entry, required_relaxation in zip(candidates, relaxations):
+            if required_relaxation <= relaxation:
+                filtered_candidates.append(entry)
+
+        # Finally, pick a random segment according to their weight
+        weights = [entry['weight'] for entry in filtered_candidates]
+        sampler = WeightedSampler([entry['index'] for entry in filtered_candidates], weights)
+        index = sampler.sample(self.uniforms.next())
+        self.record_pick(index)
+        return self.segments[index]
+
+    def record_pick(self, index):
+        self.last_picked[index] = self.picks
+        self.picks += 1
+        self.schedule(index)
+
+    def get_required_relaxation(self, index, cool_down):
+        """
+        A segment honours its cool down if it is not among the last `cool_down` picks. With a
+        relaxation r, it only may not be among the last `cool_down - r` picks.
+        :return: The smallest relaxation for which the segment honours its cool down
+        """
+        last_picked = self.last_picked[index]
+        if last_picked is None:
+            return 0
+        # A distance of 1 means that the segment was the last pick
+        distance = self.picks - last_picked
+        return max(0, cool_down - distance + 1)
+
+    def get_pending_segments(self):
+        """
+        :return: The segments that still have a timestamp that has not been picked, in the order
+                 of the task file
+        """
+        indices = {index for _, index in self.pending_timestamps}
+        indices.update(index for index, _ in self.due_timestamps)
+        return [self.segments[index] for index in sorted(indices)]
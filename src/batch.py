@@ -0,0 +1,55 @@
+import os
+
+from src.pool import WorkerPool
+
+
+def parse_seeds(value):
+    """
+    :param str value: A range (e.g. '1..500', inclusive), a comma separated list of seeds or
+                      the location of a file with one seed per line
+    :rtype: list
+    """
+    if os.path.isfile(value):
+        with open(value, 'r') as handle:
+            return [int(line) for line in handle.read().split('\n') if line.strip() != '']
+    if '..' in value:
+        first, last = value.split('..')
+        return list(range(int(first), int(last) + 1))
+    return [int(seed) for seed in value.split(',')]
+
+
+def _load_batch(load, batch):
+    return (load(),) + batch
+
+
+def _run_variant(batch, seed):
+    task, output_name, generate, args, show_progress = batch
+    variant = task.create_variant(seed)
+    variant.logger.enabled = show_progress
+    generate(variant, f'{output_name}_{seed}', args)
+    return seed
+
+
+def run_variants(task, load, seeds, output_name, generate, args, jobs=1):
+    """
+    Generates a variant of a loaded task for each seed. Worker processes load the task once,
+    when they are started. Loaded audio can not be sent to them (it may be mapped from the disk
+    cache or a bundle), so they load it themselves, which maps the audio that the first load
+    cached instead of decoding it again. This works with any start method of the processes.
+    :param Task task:
+    :param load: Function without arguments that loads the task again
+    :param list seeds:
+    :param str output_name: Base name of the outputs, the seed of each variant is appended
+    :param generate: Function (task, output name, args) that generates and exports a variant
+    :param args: Command line arguments, passed on to generate
+    :param int jobs: Number of worker processes
+    """
+    # Progress bars of parallel variants would be drawn over each other
+    batch = (output_name, generate, args, jobs <= 1)
+    if jobs <= 1:
+        for seed in seeds:
+            _run_variant((task,) + batch, seed)
+        return
+    with WorkerPool(jobs, _load_batch, load, batch) as pool:
+        for seed in pool.map(_run_variant, seeds):
+            print(f'Variant {seed} complete.')
@@ -0,0 +1,132 @@
+import json
+import mmap
+import struct
+
+from pydub import AudioSegment
+
+from src.render import AudioFormat
+
+MAGIC = b'HIPPOBND'
+VERSION = 1
+# Magic, version and length of the header
+PREAMBLE = struct.Struct('<8sIQ')
+# The PCM region starts at a multiple of this, such that it is page aligned when mapped
+ALIGNMENT = 4096
+# Folder under which the audio files of a bundle are referenced, in place of an audio folder
+BUNDLE_FOLDER = '<bundle>'
+
+
+def is_bundle(path):
+    with open(path, 'rb') as handle:
+        return handle.read(len(MAGIC)) == MAGIC
+
+
+def write_bundle(path, task_file, audio_folder, audio_cache, jobs=1):
+    """
+    Compiles a task file and the audio files it references into a single file. The audio is
+    decoded, converted to a single format (that of the task settings, if it has one) and stored
+    as one contiguous region of PCM, preceded by a JSON header with the task file and the
+    location of each clip in that region.
+    :param str path: Location of the bundle
+    :param dict task_file:
+    :param str audio_folder:
+    :param AudioCache audio_cache:
+    :param int jobs: Number of worker processes used to decode the audio files
+    """
+    names = [segment_json['audio'] for segment_json in task_file['segments']]
+    for effect_json in task_file.get('effects', []):
+        if effect_json.get('type') == 'overlay':
+            names.append(effect_json['audio'])
+    names = list(dict.fromkeys(names))
+
+    paths = [audio_folder + '/' + name for name in names]
+    if 'format' in task_file['settings']:
+        audio_format = AudioFormat.from_json(task_file['settings']['format'])
+        audio_cache.preload(paths, jobs, audio_format)
+        clips = [audio_cache.load(path, audio_format) for path in paths]
+    else:
+        audio_cache.preload(paths, jobs)
+        clips = [audio_cache.load(path) for path in paths]
+        audio_format = AudioFormat.common(clips)
+
+    clip_table = {}
+    offset = 0
+    for name, clip in zip(names, clips):
+        frame_count = int(audio_format.convert(clip).frame_count())
+        clip_table[name] = [offset, frame_count]
+        offset += frame_count * audio_format.frame_width
+
+    header = json.dumps({
+        'task': task_file,
+        'format': audio_format.to_json(),
+        'clips': clip_table
+    }).encode('utf-8')
+    data_start = PREAMBLE.size + len(header)
+    padding = -data_start % ALIGNMENT
+
+    with open(path, 'wb') as handle:
+        handle.write(PREAMBLE.pack(MAGIC, VERSION, len(header)))
+        handle.write(header)
+        handle.write(b'\0' * padding)
+        for clip in clips:
+            handle.write(audio_format.convert(clip).raw_data)
+
+
+class Bundle:
+    def __init__(self, path):
+        """
+        A compiled task, which serves the audio of its clips straight from a memory mapping of
+        the bundle. It is used in place of an AudioCache when loading the task, with
+        BUNDLE_FOLDER as audio folder. No audio is decoded when the task is loaded, though encoding
+        the output (e.g. to MP3) still needs ffmpeg.
+        :param str path: Location of the bundle
+        """
+        with open(path, 'rb') as handle:
+            magic, version, header_length = PREAMBLE.unpack(handle.read(PREAMBLE.size))
+            if magic != MAGIC:
+                raise ValueError(f'\'{path}\' is not a task bundle')
+            if version != VERSION:
+                raise ValueError(f'Task bundle \'{path}\' has unsupported version {version}')
+            header = json.loads(handle.read(header_length).decode('utf-8'))
+            # The mapping stays valid after the file is closed
+            self.data = memoryview(mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ))
+
+        data_start = PREAMBLE.size + header_length
+        self.data_start = data_start + (-data_start % ALIGNMENT)
+        self.task_file = header['task']
+        self.audio_format = AudioFormat.from_json(header['format'])
+        self.clips = header['clips']
+        self.lazy = False
+        self.loaded = {}
+
+    def load(self, path, audio_format=None):
+        """
+        :param str path: Location of the audio file, i.e. its name in the task file under
+                         BUNDLE_FOLDER
+        :param AudioFormat audio_format: Format to convert the audio to, which is only needed
+                                         if the bundle was compiled in another format
+        :rtype: AudioSegment
+        """
+        name = path[len(BUNDLE_FOLDER) + 1:]
+        key = (name, None if audio_format is None else audio_format.get_key())
+        if key not in self.loaded:
+            offset, frame_count = self.clips[name]
+            start = self.data_start + offset
+            end = start + frame_count * self.audio_format.frame_width
+            audio = AudioSegment(
+                data=self.data[start:end],
+                sample_width=self.audio_format.sample_width,
+                frame_rate=self.audio_format.frame_rate,
+                channels=self.audio_format.channels
+            )
+            self.loaded[key] = audio if audio_format is None else audio_format.convert(audio)
+        return self.loaded[key]
+
+    def open(self, path, audio_format=None):
+        return self.load(path, audio_format)
+
+    def preload(self, paths, jobs=1, audio_format=None):
+        pass
+
+    def probe_all(self, paths, jobs=1):
+        pass
@@ -0,0 +1,324 @@
+import hashlib
+import json
+import mmap
+import os
+import tempfile
+import wave
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+from pydub import AudioSegment
+from pydub.utils import mediainfo
+
+
+def default_cache_directory():
+    return os.path.join(os.path.expanduser('~'), '.cache', 'hippo')
+
+
+def decode(path, audio_format=None):
+    """
+    :param str path:
+    :param AudioFormat audio_format: Format to convert the audio to, or None to keep its own
+    :rtype: AudioSegment
+    """
+    audio = AudioSegment.from_file(path)
+    return audio if audio_format is None else audio_format.convert(audio)
+
+
+def write_atomically(path, data):
+    """
+    Writes a file via a uniquely named temporary file in the same directory, which is then
+    renamed into place. Concurrent writers and readers never see a partially written file.
+    Writers of the same path are expected to write the same data, so if another writer's file
+    can not be replaced, that one is kept.
+    :param str path:
+    :param bytes data:
+    """
+    directory, name = os.path.split(path)
+    handle = tempfile.NamedTemporaryFile(dir=directory, prefix=name + '.', suffix='.tmp', delete=False)
+    try:
+        with handle:
+            handle.write(data)
+        try:
+            os.replace(handle.name, path)
+        except OSError:
+            # E.g. on Windows, where a file that is mapped by another process can not be replaced
+            if not os.path.exists(path):
+                raise
+    finally:
+        if os.path.exists(handle.name):
+            os.remove(handle.name)
+
+
+def get_target_format(audio_format):
+    return 'native' if audio_format is None else audio_format.get_key()
+
+
+def get_length(frame_count, frame_rate):
+    """
+    :return: The length in milliseconds, rounded the same way pydub does
+    :rtype: int
+    """
+    return round(1000 * (frame_count / frame_rate))
+
+
+def probe_wav(path):
+    """
+    :return: The length (in milliseconds) of a WAV file, read from its header, or None if the
+             wave module can not read it (e.g. float samples or WAVE_FORMAT_EXTENSIBLE before
+             Python 3.12), in which case it has to be probed like any other file
+    :rtype: int
+    """
+    try:
+        with wave.open(path, 'rb') as handle:
+            return get_length(handle.getnframes(), handle.getframerate())
+    except (wave.Error, EOFError):
+        return None
+
+
+def fit_length(audio, duration):
+    """
+    Trims audio to a length, or pads it with silence
+    :param AudioSegment audio:
+    :param int duration: Length in milliseconds
+    :rtype: AudioSegment
+    """
+    if len(audio) == duration:
+        return audio
+    frame_width = audio.sample_width * audio.channels
+    frame_count = int(audio.frame_count())
+    target_count = round(duration * audio.frame_rate / 1000)
+    if target_count <= frame_count:
+        data = audio.raw_data[:target_count * frame_width]
+    else:
+        data = bytes(audio.raw_data) + b'\0' * ((target_count - frame_count) * frame_width)
+    return AudioSegment(data=data, sample_width=audio.sample_width, frame_rate=audio.frame_rate, channels=audio.channels)
+
+
+class LazyAudio:
+    def __init__(self, audio_cache, path, duration, audio_format=None):
+        """
+        Handle to an audio file that is only decoded when it is first used
+        :param AudioCache audio_cache:
+        :param str path:
+        :param int duration: Length in milliseconds, as probed from the file, to which the
+                             decoded audio is fitted
+        :param AudioFormat audio_format: Format to convert the audio to, or None to keep its own
+        """
+        self.audio_cache = audio_cache
+        self.path = path
+        self.duration = duration
+        self.audio_format = audio_format
+
+    def load(self):
+        """
+        :return: The decoded audio, trimmed or padded to the probed length, which is the length
+                 the task was planned with
+        :rtype: AudioSegment
+        """
+        return fit_length(self.audio_cache.load(self.path, self.audio_format), self.duration)
+
+    def __len__(self):
+        return self.duration
+
+
+class AudioCache:
+    def __init__(self, directory=None, lazy=False, max_size=None):
+        """
+        Cache of decoded audio. Within one run every file is only decoded once, no matter how
+        often it is referenced. If a directory is given, the decoded PCM is also stored on disk
+        such that subsequent runs can open it via mmap instead of decoding it again. Audio that
+        is converted to a format when it is loaded is cached in that format, separately from
+        the audio as it was decoded.
+        :param str directory: Location of the persistent cache, or None to only cache in memory
+        :param bool lazy: If True, segment audio is only decoded when it is first used and its
+                          duration is probed from the file instead
+        :param int max_size: Maximum size (in bytes) of the decoded audio held in memory, after
+                             which the least recently used audio is dropped. None for no limit
+        """
+        self.directory = directory
+        self.lazy = lazy
+        self.max_size = max_size
+        self.loaded = OrderedDict()
+        self.size = 0
+        self.durations = {}
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def load(self, path, audio_format=None):
+        """
+        :param str path: Location of the audio file
+        :param AudioFormat audio_format: Format to convert the audio to, or None to keep its own
+        :rtype: AudioSegment
+        """
+        key = self.get_key(path, get_target_format(audio_format))
+        if key in self.loaded:
+            self.loaded.move_to_end(key)
+            return self.loaded[key]
+        audio = self.read(key)
+        if audio is None:
+            if audio_format is None:
+                audio = decode(path)
+            else:
+                # Convert from the decoded audio if that is cached, without holding on to it
+                decoded = self.read(self.get_key(path))
+                audio = decode(path, audio_format) if decoded is None else audio_format.convert(decoded)
+            self.write(key, audio)
+        self.keep(key, audio)
+        return audio
+
+    def open(self, path, audio_format=None):
+        """
+        :param str path: Location of the audio file
+        :param AudioFormat audio_format: Format to convert the audio to, or None to keep its own
+        :return: The decoded audio or, if the cache is lazy, a handle that decodes it on first use
+        :rtype: AudioSegment | LazyAudio
+        """
+        if not self.lazy:
+            return self.load(path, audio_format)
+        return LazyAudio(self, path, self.probe(path), audio_format)
+
+    def keep(self, key, audio):
+        """
+        Holds on to decoded audio, dropping the least recently used audio if it does not fit
+        """
+        self.loaded[key] = audio
+        self.size += len(audio.raw_data)
+        while self.max_size is not None and self.size > self.max_size and len(self.loaded) > 1:
+            _, dropped = self.loaded.popitem(last=False)
+            self.size -= len(dropped.raw_data)
+
+    def probe(self, path):
+        """
+        Finds the length of an audio file without decoding it: from the header if it is a WAV
+        file the wave module can read and otherwise with ffprobe, of which the result is kept in
+        the persistent cache.
+        The length is always probed the same way, rather than taken from decoded audio when that
+        is cached, such that a plan does not depend on what was decoded before. For compressed
+        files it may differ by a few milliseconds from the length of the decoded audio.
+        :param str path:
+        :return: The length in milliseconds
+        :rtype: int
+        """
+        key = self.get_key(path)
+        if key in self.durations:
+            return self.durations[key]
+        duration = probe_wav(path) if path.lower().endswith('.wav') else None
+        if duration is None:
+            duration = self.read_duration(key)
+            if duration is None:
+                duration = round(1000 * float(mediainfo(path)['duration']))
+                self.write_duration(key, duration)
+        self.durations[key] = duration
+        return duration
+
+    def probe_all(self, paths, jobs=1):
+        """
+        Probes the lengths of all given files, running up to `jobs` probes at a time
+        """
+        paths = list(dict.fromkeys(paths))
+        if jobs <= 1:
+            for path in paths:
+                self.probe(path)
+            return
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            list(executor.map(self.probe, paths))
+
+    def preload(self, paths, jobs=1, audio_format=None):
+        """
+        Decodes all given files that are not cached yet, using a pool of worker processes.
+        Files are handed out in the given order and, if decoding fails, the error of the first
+        failing file in that order is raised, regardless of which worker finished first.
+        :param list paths: Locations of the audio files
+        :param int jobs: Number of worker processes
+        :param AudioFormat audio_format: Format to convert the audio to, or None to keep its own
+        """
+        target_format = get_target_format(audio_format)
+        pending = {}
+        for path in paths:
+            key = self.get_key(path, target_format)
+            if key in self.loaded or key in pending:
+                continue
+            audio = self.read(key)
+            if audio is not None:
+                self.keep(key, audio)
+            else:
+                pending[key] = path
+        if len(pending) == 0:
+            return
+        if jobs <= 1 or len(pending) == 1:
+            decoded = map(partial(decode, audio_format=audio_format), pending.values())
+            self.store(pending.keys(), decoded)
+        else:
+            with ProcessPoolExecutor(max_workers=min(jobs, len(pending))) as executor:
+                decoded = executor.map(partial(decode, audio_format=audio_format), pending.values())
+                self.store(pending.keys(), decoded)
+
+    def store(self, keys, decoded):
+        for key, audio in zip(keys, decoded):
+            self.write(key, audio)
+            self.keep(key, audio)
+
+    @staticmethod
+    def get_key(path, target_format='native'):
+        """
+        Content address of a decoded file. A file that changes on disk (size or modification
+        time) gets a new key, such that stale entries are never read.
+        """
+        stat = os.stat(path)
+        description = f'{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}|{target_format}'
+        return hashlib.sha1(description.encode('utf-8')).hexdigest()
+
+    def read_header(self, key):
+        if self.directory is None:
+            return None
+        header_path = os.path.join(self.directory, key + '.json')
+        data_path = os.path.join(self.directory, key + '.pcm')
+        if not os.path.exists(header_path) or not os.path.exists(data_path):
+            return None
+        with open(header_path, 'r') as handle:
+            return json.loads(handle.read())
+
+    def read_duration(self, key):
+        if self.directory is None:
+            return None
+        duration_path = os.path.join(self.directory, key + '.duration')
+        if not os.path.exists(duration_path):
+            return None
+        with open(duration_path, 'r') as handle:
+            return int(handle.read())
+
+    def write_duration(self, key, duration):
+        if self.directory is not None:
+            write_atomically(os.path.join(self.directory, key + '.duration'), str(duration).encode('utf-8'))
+
+    def read(self, key):
+        header = self.read_header(key)
+        if header is None:
+            return None
+        data_path = os.path.join(self.directory, key + '.pcm')
+        if os.path.getsize(data_path) == 0:
+            data = b''
+        else:
+            with open(data_path, 'rb') as handle:
+                # The mapping stays valid after the file is closed
+                data = memoryview(mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ))
+        return AudioSegment(
+            data=data,
+            sample_width=header['sample_width'],
+            frame_rate=header['frame_rate'],
+            channels=header['channels']
+        )
+
+    def write(self, key, audio):
+        if self.directory is None:
+            return
+        header = {
+            'sample_width': audio.sample_width,
+            'frame_rate': audio.frame_rate,
+            'channels': audio.channels
+        }
+        # The header is written last, as entries without one are not read
+        write_atomically(os.path.join(self.directory, key + '.pcm'), audio.raw_data)
+        write_atomically(os.path.join(self.directory, key + '.json'), json.dumps(header).encode('utf-8'))
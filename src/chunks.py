@@ -0,0 +1,51 @@
+import os
+
+import numpy as np
+
+from src.cache import write_atomically
+
+
+class ChunkCache:
+    def __init__(self, directory):
+        """
+        Persistent cache of processed chunks of the output. Chunks are stored under a content
+        address, e.g. of the placements and effects that make up a chunk, such that a run only
+        renders (or encodes) the chunks that differ from those of earlier runs.
+        :param str directory:
+        """
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+
+    def get_path(self, key, extension):
+        return os.path.join(self.directory, f'{key}.{extension}')
+
+    def read(self, key, audio_format, frames):
+        """
+        :param str key:
+        :param AudioFormat audio_format:
+        :param int frames: Expected length of the chunk
+        :return: The samples of the chunk with shape (frames, channels), or None if not cached
+        :rtype: np.ndarray
+        """
+        path = self.get_path(key, 'pcm')
+        if not os.path.exists(path) or os.path.getsize(path) != frames * audio_format.frame_width:
+            return None
+        return np.fromfile(path, dtype=audio_format.sample_type).reshape(-1, audio_format.channels)
+
+    def write(self, key, samples):
+        self.write_bytes(key, 'pcm', np.ascontiguousarray(samples))
+
+    def read_bytes(self, key, extension):
+        """
+        :return: The cached data, or None if not cached
+        :rtype: bytes
+        """
+        path = self.get_path(key, extension)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as handle:
+            return handle.read()
+
+    def write_bytes(self, key, extension, data):
+        # Concurrent runs may write the same chunk, which is why each writes a file of its own first
+        write_atomically(self.get_path(key, extension), data)
@@ -0,0 +1,51 @@
+import shutil
+
+from src.render import AudioFormat
+from src.sinks import WavSink, read_wav_header
+
+# Formats of which files can be joined by appending their bytes. MP3 files qualify if they are bare
+# streams of frames, as written by ParallelMp3Sink for slices
+BYTE_FORMATS = ['pcm', 'mp3']
+# Number of bytes copied at a time when joining WAV files
+WAV_BLOCK_SIZE = 4 * 1024 * 1024
+
+
+def concat_files(paths, output):
+    """
+    Joins slices of an output (see render.py) into a single file, without encoding anything
+    again. The format follows from the extension of the output.
+    :param list paths: Locations of the slices, in order
+    :param str output: Location of the joined file
+    """
+    extension = output.rsplit('.', 1)[-1].lower()
+    if extension == 'wav':
+        concat_wav_files(paths, output)
+    elif extension in BYTE_FORMATS:
+        with open(output, 'wb') as handle:
+            for path in paths:
+                with open(path, 'rb') as part:
+                    shutil.copyfileobj(part, handle)
+    else:
+        raise ValueError(f'Files of type \'{extension}\' can not be joined, use one of {["wav"] + BYTE_FORMATS}')
+
+
+def concat_wav_files(paths, output):
+    sink = None
+    try:
+        for path in paths:
+            with open(path, 'rb') as part:
+                channels, sample_width, frame_rate, size = read_wav_header(part)
+                if sink is None:
+                    params = (channels, sample_width, frame_rate)
+                    sink = WavSink(output, AudioFormat(frame_rate, channels, sample_width))
+                elif (channels, sample_width, frame_rate) != params:
+                    raise ValueError(f'\'{path}\' has another format than the previous slices')
+                while size > 0:
+                    data = part.read(min(size, WAV_BLOCK_SIZE))
+                    if len(data) == 0:
+                        raise ValueError(f'\'{path}\' ends before its audio does')
+                    sink.write_bytes(data)
+                    size -= len(data)
+    finally:
+        if sink is not None:
+            sink.close()
@@ -0,0 +1,206 @@
+import itertools
+import json
+import threading
+from collections import deque
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import time
+
+from src.cache import AudioCache
+from src.pool import WorkerPool
+
+
+def _create_worker(run_job, cache_directory, lazy, max_cache_size):
+    # The audio cache stays warm between the jobs that the process runs
+    return run_job, AudioCache(cache_directory, lazy, max_cache_size)
+
+
+def _run_job(worker, job):
+    run_job, audio_cache = worker
+    started = time()
+    metrics = run_job(job, audio_cache)
+    return started, time(), metrics
+
+
+def _ping(worker):
+    return True
+
+
+class JobRunner:
+    def __init__(self, run_job, jobs=1, cache_directory=None, lazy=False, max_cache_size=None, history=1000):
+        """
+        Runs jobs on a pool of long-running worker processes, which each keep a warm cache of
+        decoded audio. Clips that are cached on disk are read via mmap, such that the processes
+        share their pages instead of each holding a copy. Only the statuses of the last `history`
+        finished jobs are kept, such that a server that runs for a long time does not grow.
+        :param run_job: Function (job, audio cache) that runs a job and returns its metrics as JSON
+        :param int jobs: Number of worker processes
+        :param str cache_directory: Location of the persistent cache, or None to only cache in memory
+        :param bool lazy: If True, segment audio is only decoded when it is first used
+        :param int max_cache_size: Maximum size (in bytes) of the decoded audio held by each worker
+        :param int history: Number of finished jobs of which the status is kept
+        """
+        self.pool = WorkerPool(jobs, _create_worker, run_job, cache_directory, lazy, max_cache_size)
+        self.jobs = jobs
+        self.history = history
+        self.records = {}
+        # Futures of the jobs that are not finished yet, and the ids of the finished jobs in order
+        self.futures = {}
+        self.finished = deque()
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def warm_up(self):
+        """
+        Starts all worker processes, such that the first jobs do not have to wait for them
+        """
+        futures = [self.pool.submit(_ping) for _ in range(self.jobs)]
+        for future in futures:
+            future.result()
+
+    def submit(self, job):
+        """
+        :param dict job:
+        :return: The id of the job
+        :rtype: str
+        """
+        with self.lock:
+            job_id = str(next(self.ids))
+            self.records[job_id] = {
+                'id': job_id,
+                'output': job.get('output'),
+                'submitted': time(),
+                'status': 'queued'
+            }
+            future = self.pool.submit(_run_job, job)
+            self.futures[job_id] = future
+        # Outside of the lock, as the callback is called right away if the job has finished already
+        future.add_done_callback(partial(self.finish, job_id))
+        return job_id
+
+    def finish(self, job_id, future):
+        """
+        Records the outcome of a job in its status and drops its future, as well as the statuses
+        of the jobs that finished longest ago
+        :param str job_id:
+        :param Future future: The future of the job, which is done
+        """
+        outcome = {}
+        if future.cancelled():
+            outcome['status'] = 'cancelled'
+        elif future.exception() is not None:
+            error = future.exception()
+            outcome['status'] = 'failed'
+            outcome['error'] = f'{type(error).__name__}: {error}'
+        else:
+            started, finished, metrics = future.result()
+            outcome['status'] = 'done'
+            outcome['started'] = started
+            outcome['finished'] = finished
+            outcome['running_time'] = finished - started
+            outcome['metrics'] = metrics
+        with self.lock:
+            record = self.records[job_id]
+            if 'started' in outcome:
+                outcome['waiting_time'] = outcome['started'] - record['submitted']
+            record.update(outcome)
+            del self.futures[job_id]
+            self.finished.append(job_id)
+            while len(self.finished) > self.history:
+                del self.records[self.finished.popleft()]
+
+    def get_status(self, job_id):
+        """
+        :return: The status of the job (queued, running, done, failed or cancelled) with its
+                 timings, or None if there is no job with that id (anymore)
+        :rtype: dict
+        """
+        with self.lock:
+            if job_id not in self.records:
+                return None
+            status = dict(self.records[job_id])
+            future = self.futures.get(job_id)
+        if future is not None and future.running():
+            status['status'] = 'running'
+        return status
+
+    def get_statuses(self):
+        with self.lock:
+            job_ids = list(self.records.keys())
+        # Jobs may be dropped from the history in the meantime
+        statuses = [self.get_status(job_id) for job_id in job_ids]
+        return [status for status in statuses if status is not None]
+
+    def shutdown(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """
+    POST /jobs submits a job, GET /jobs lists all jobs and GET /jobs/<id> reports a single job
+    """
+    runner = None
+    # Function (job) that raises a ValueError if a job is not valid, such that it is rejected
+    check_job = None
+
+    def do_GET(self):
+        path = self.path.rstrip('/')
+        if path == '/jobs':
+            self.respond(200, self.runner.get_statuses())
+        elif path.startswith('/jobs/'):
+            status = self.runner.get_status(path[len('/jobs/'):])
+            if status is None:
+                self.respond(404, {'error': 'Unknown job'})
+            else:
+                self.respond(200, status)
+        else:
+            self.respond(404, {'error': 'Unknown path'})
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/jobs':
+            self.respond(404, {'error': 'Unknown path'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            job = json.loads(self.rfile.read(length))
+        except ValueError:
+            self.respond(400, {'error': 'The job is not valid JSON'})
+            return
+        if not isinstance(job, dict) or 'task' not in job:
+            self.respond(400, {'error': 'A job needs a task'})
+            return
+        if self.check_job is not None:
+            try:
+                self.check_job(job)
+            except ValueError as error:
+                self.respond(400, {'error': str(error)})
+                return
+        self.respond(202, {'id': self.runner.submit(job)})
+
+    def respond(self, code, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def serve(runner, host='127.0.0.1', port=8787, check_job=None):
+    """
+    Serves the job runner over HTTP until interrupted
+    :param JobRunner runner:
+    :param str host:
+    :param int port:
+    :param check_job: Function (job) that raises a ValueError if a job is not valid, in which case
+                      it is rejected with the message of the error
+    """
+    handler = type('Handler', (JobRequestHandler,), {'runner': runner, 'check_job': staticmethod(check_job)})
+    server = ThreadingHTTPServer((host, port), handler)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        runner.shutdown()
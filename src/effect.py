@@ -1,35 +1,64 @@
-from pydub import AudioSegment
+import hashlib
 
+import numpy as np
+from pydub.utils import db_to_float
+
+from src.render import to_sample_type
 from src.util import extract
 
 
 class Effect:
-    def post_finalise(self, result):
-        pass
+    """
+    Effects are not applied one by one, but compiled into an EffectChain. Each effect multiplies
+    the output so far by a (linear) gain and/or adds a looped layer of audio to it.
+    """
+
+    def get_multiplier(self):
+        """
+        :return: Linear gain applied to the output so far
+        :rtype: float
+        """
+        return 1.0
+
+    def get_layer(self, audio_format):
+        """
+        :param AudioFormat audio_format:
+        :return: Samples (with shape (frames, channels)) that are looped over the output, or None
+        :rtype: np.ndarray
+        """
+        return None
+
+    def to_json(self):
+        """
+        :return: The effect as it is written in a task file
+        :rtype: dict
+        """
+        return {'type': 'none'}
 
 
 class OverlayEffect(Effect):
-    def __init__(self, overlay, gain) -> None:
+    def __init__(self, overlay, gain, audio_name=None) -> None:
         """
         :param AudioSegment overlay:
         :param in gain:
+        :param str audio_name: Location of the audio file relative to the audio folder
         """
         super().__init__()
         self.overlay = overlay
         self.gain = gain
+        self.audio_name = audio_name
 
-    def post_finalise(self, result) -> None:
-        """
-        :param Result result:
-        """
-        self.overlay = self.overlay.apply_gain(self.gain)
-        result.audio = result.audio.overlay(self.overlay, position=0, loop=True)
+    def get_layer(self, audio_format):
+        return audio_format.to_samples(self.overlay) * db_to_float(float(self.gain))
+
+    def to_json(self):
+        return {'type': 'overlay', 'audio': self.audio_name, 'gain': self.gain}
 
     @staticmethod
-    def from_json(json, audio_folder):
-        audio = AudioSegment.from_mp3(audio_folder + '/' + json['audio'])
+    def from_json(json, audio_folder, audio_cache, audio_format=None):
+        audio = audio_cache.load(audio_folder + '/' + json['audio'], audio_format)
         gain = extract('gain', json, 0)
-        return OverlayEffect(audio, gain)
+        return OverlayEffect(audio, gain, json['audio'])
 
 
 class PostVolumeGainEffect(Effect):
@@ -40,11 +69,73 @@ class PostVolumeGainEffect(Effect):
         super().__init__()
         self.gain = gain
 
-    def post_finalise(self, result):
-        result.audio = result.audio.apply_gain(self.gain)
-        pass
+    def get_multiplier(self):
+        return db_to_float(float(self.gain))
+
+    def to_json(self):
+        return {'type': 'post_volume_gain', 'gain': self.gain}
 
     @staticmethod
     def from_json(json):
         gain = extract('gain', json, 0)
         return PostVolumeGainEffect(gain)
+
+
+class EffectChain:
+    def __init__(self, effects, audio_format):
+        """
+        Compiles a list of effects into a single pass over the output. Every gain is folded into
+        one multiplier for the rendered audio and one coefficient per layer, such that each
+        sample is scaled, mixed and clipped only once.
+        :param list effects:
+        :param AudioFormat audio_format:
+        """
+        self.multiplier = 1.0
+        self.layers = []
+        for effect in effects:
+            multiplier = effect.get_multiplier()
+            self.multiplier *= multiplier
+            self.layers = [layer * multiplier for layer in self.layers]
+            layer = effect.get_layer(audio_format)
+            if layer is not None and len(layer) > 0:
+                self.layers.append(layer)
+        self.fingerprint = None
+
+    def get_fingerprint(self):
+        """
+        :return: A hash of the multiplier and the layers, which is the same for chains that
+                 process audio the same way
+        :rtype: str
+        """
+        if self.fingerprint is None:
+            fingerprint = hashlib.sha1(repr(self.multiplier).encode('utf-8'))
+            for layer in self.layers:
+                fingerprint.update(repr(layer.shape).encode('utf-8'))
+                fingerprint.update(np.ascontiguousarray(layer))
+            self.fingerprint = fingerprint.hexdigest()
+        return self.fingerprint
+
+    def is_identity(self):
+        return self.multiplier == 1.0 and len(self.layers) == 0
+
+    def apply(self, samples, position):
+        """
+        :param np.ndarray samples: Chunk of the output with shape (frames, channels)
+        :param int position: Frame offset of the chunk in the output
+        :return: The processed chunk
+        :rtype: np.ndarray
+        """
+        if self.is_identity():
+            return samples
+        mixed = samples * self.multiplier
+        for layer in self.layers:
+            # The layer is looped over the whole output, so the chunk starts somewhere within the
+            # loop. Add it piece by piece, instead of tiling it to the length of the chunk
+            offset = 0
+            start = position % len(layer)
+            while offset < len(samples):
+                length = min(len(layer) - start, len(samples) - offset)
+                mixed[offset:offset + length] += layer[start:start + length]
+                offset += length
+                start = 0
+        return to_sample_type(np.floor(mixed), samples.dtype)
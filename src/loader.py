@@ -0,0 +1,143 @@
+import json
+
+from pydub import AudioSegment
+
+from src.cache import AudioCache, default_cache_directory
+from src.effect import OverlayEffect, PostVolumeGainEffect
+from src.metrics import Metrics
+from src.render import AudioFormat
+from src.segment import Segment
+from src.settings import Settings
+from src.task import Task
+from src.util import extract
+
+
+class SegmentGenerator:
+    def __init__(self, length, audio_format=None):
+        self.length = length
+        self.audio_format = audio_format
+
+    def generate_breath_pause(self):
+        if self.audio_format is None:
+            silence = AudioSegment.silent(self.length)
+        else:
+            silence = self.audio_format.convert(AudioSegment.silent(self.length, self.audio_format.frame_rate))
+        return Segment('silent', '', '', silence, None, [], [])
+
+
+def load_json(file_name):
+    with open(file_name, 'r') as handle:
+        raw = handle.read()
+        return json.loads(raw)
+
+
+def load_segments(task_file, audio_folder, max_time, audio_cache, audio_format=None):
+    segments = []
+    for segment_json in task_file["segments"]:
+        segments.append(Segment.from_json(segment_json, audio_folder, max_time, audio_cache, audio_format))
+    return segments
+
+
+def load_settings(task_file, arg_duration, arg_seed):
+    settings = task_file['settings']
+    if arg_seed is None and 'seed' not in settings:
+        seed = None
+    else:
+        seed = int(arg_seed) if arg_seed is not None else settings['seed']
+
+    if arg_duration is None and 'duration' not in settings:
+        print('No duration specified, using the default of 30 seconds')
+        duration = 30
+    else:
+        duration = int(arg_duration) if arg_duration is not None else settings['duration']
+
+    breath_pause_length = settings['breath_pause_length']
+    audio_format = None
+    if 'format' in settings:
+        audio_format = AudioFormat.from_json(settings['format'])
+    return Settings(seed, duration, breath_pause_length, audio_format)
+
+
+def load_effects(task_file, audio_folder, audio_cache, audio_format=None):
+    effects = []
+    for effect_json in extract('effects', task_file, []):
+        effect_type = extract('type', effect_json, 'none')
+        if effect_type == 'overlay':
+            effects.append(OverlayEffect.from_json(effect_json, audio_folder, audio_cache, audio_format))
+        elif effect_type == 'post_volume_gain':
+            effects.append(PostVolumeGainEffect.from_json(effect_json))
+        else:
+            print(f'unknown effect {effect_type}')
+    return effects
+
+
+def get_segment_audio_paths(task_file, audio_folder):
+    return [audio_folder + '/' + segment_json['audio'] for segment_json in task_file['segments']]
+
+
+def get_effect_audio_paths(task_file, audio_folder):
+    paths = []
+    for effect_json in extract('effects', task_file, []):
+        if extract('type', effect_json, 'none') == 'overlay':
+            paths.append(audio_folder + '/' + effect_json['audio'])
+    return paths
+
+
+def load_task(task_file, audio_folder, arg_duration, arg_seed, audio_cache=None, jobs=1, metrics=None):
+    if audio_cache is None:
+        audio_cache = AudioCache()
+    if metrics is None:
+        metrics = Metrics()
+    with metrics.phase('load'):
+        settings = load_settings(task_file, arg_duration, arg_seed)
+    # Decode all distinct audio files up front, such that this can be done in parallel. When
+    # loading lazily, only the lengths of the segment audio files are needed up front. If the
+    # task has an output format, the audio is converted to it here (and cached in it), once
+    audio_format = settings.audio_format
+    segment_audio_paths = get_segment_audio_paths(task_file, audio_folder)
+    effect_audio_paths = get_effect_audio_paths(task_file, audio_folder)
+    with metrics.phase('decode'):
+        if audio_cache.lazy:
+            audio_cache.probe_all(segment_audio_paths, jobs)
+            audio_cache.preload(effect_audio_paths, jobs, audio_format)
+        else:
+            audio_cache.preload(segment_audio_paths + effect_audio_paths, jobs, audio_format)
+    with metrics.phase('load'):
+        segments = load_segments(task_file, audio_folder, settings.duration, audio_cache, audio_format)
+        segment_generator = SegmentGenerator(settings.breath_pause_length, audio_format)
+        effects = load_effects(task_file, audio_folder, audio_cache, audio_format)
+    return Task(segments, settings, segment_generator, effects, metrics)
+
+
+def add_cache_arguments(parser, jobs_help):
+    """
+    Adds the options of the cache of decoded audio and of the number of worker processes, which
+    all command line tools share
+    :param argparse.ArgumentParser parser:
+    :param str jobs_help: What the worker processes of the tool do
+    """
+    parser.add_argument(
+        '--cache-directory',
+        help='Directory in which decoded audio files are cached between runs',
+        default=default_cache_directory()
+    )
+    parser.add_argument(
+        '--no-cache',
+        help='With this flag enabled, decoded audio files are not cached between runs',
+        action='store_const',
+        const=True,
+        default=False
+    )
+    parser.add_argument(
+        '-j', '--jobs',
+        help=jobs_help,
+        default=1
+    )
+
+
+def get_cache_directory(args):
+    """
+    :return: The directory of the persistent cache, or None if it is disabled
+    :rtype: str
+    """
+    return None if args.no_cache else args.cache_directory
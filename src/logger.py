@@ -1,9 +1,31 @@
 import sys
+from time import perf_counter
 
 
 class Logger:
-    @staticmethod
-    def print_progress(iteration, total, prefix='', suffix='', decimals=1, bar_length=100):
+    def __init__(self, enabled=True, interval=0.1):
+        """
+        :param bool enabled:
+        :param float interval: Minimum time (in seconds) between two updates of a progress bar
+        """
+        self.enabled = enabled
+        self.interval = interval
+        self.last_print_time = None
+
+    def is_due(self, iteration, total):
+        """
+        The progress bar is only redrawn every so often, as it is updated far more often than it
+        is visible. Callers can check this before building the text of an update.
+        :return: True if print_progress would redraw the bar
+        :rtype: bool
+        """
+        if not self.enabled:
+            return False
+        if iteration >= total or self.last_print_time is None:
+            return True
+        return perf_counter() - self.last_print_time >= self.interval
+
+    def print_progress(self, iteration, total, prefix='', suffix='', decimals=1, bar_length=100):
         """
         Source: https://gist.github.com/aubricus/f91fb55dc6ba5557fbab06119420dd6a
 
@@ -16,6 +38,10 @@ class Logger:
             decimals    - Optional  : positive number of decimals in percent complete (Int)
             bar_length  - Optional  : character length of bar (Int)
         """
+        if not self.is_due(iteration, total):
+            return
+        self.last_print_time = None if iteration >= total else perf_counter()
+
         str_format = "{0:." + str(decimals) + "f}"
         percents = str_format.format(100 * (iteration / float(total)))
         filled_length = int(round(bar_length * iteration / float(total)))
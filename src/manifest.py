@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+
+from src.cache import fit_length
+from src.segment import Segment
+from src.timeline import Timeline
+
+MANIFEST_VERSION = 2
+
+
+def fingerprint_file(path):
+    """
+    :return: A hash of the contents of a file, which is the same on every machine
+    :rtype: str
+    """
+    fingerprint = hashlib.sha1()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(1024 * 1024), b''):
+            fingerprint.update(block)
+    return fingerprint.hexdigest()
+
+
+def write_manifest(path, task, audio_folder):
+    """
+    Writes the plan of a task, i.e. the result of segment selection, such that it can be
+    rendered elsewhere (see render.py) against another copy of the audio files. Clips are
+    referenced by their location relative to the audio folder and by a fingerprint of their file.
+    :param str path:
+    :param Task task: A task that has been planned
+    :param str audio_folder: Folder in which the clips are located, to fingerprint them
+    """
+    timeline = task.result.timeline
+    clips = []
+    for segment in timeline.segments:
+        audio_path = audio_folder + '/' + segment.audio_name
+        clips.append({
+            'id': segment.id,
+            'text': segment.text,
+            'text_appender_symbol': segment.text_appender_symbol,
+            'audio': segment.audio_name,
+            # The length the plan was made with, which (for a lazily loaded clip) is probed and can
+            # differ slightly from the length of the decoded audio
+            'duration': segment.duration,
+            # Clips from a task bundle have no file of their own
+            'fingerprint': fingerprint_file(audio_path) if os.path.isfile(audio_path) else None
+        })
+    audio_format = task.settings.audio_format
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'seed': task.settings.seed,
+        'duration': timeline.duration,
+        'format': None if audio_format is None else audio_format.to_json(),
+        'clips': clips,
+        'segment_indices': timeline.get_segment_indices().tolist(),
+        'starts': timeline.get_starts().tolist(),
+        'effects': [effect.to_json() for effect in task.effects]
+    }
+    with open(path, 'w') as handle:
+        handle.write(json.dumps(manifest, separators=(',', ':')))
+
+
+def read_manifest(path):
+    """
+    :rtype: dict
+    """
+    with open(path, 'r') as handle:
+        manifest = json.loads(handle.read())
+    if manifest.get('version') != MANIFEST_VERSION:
+        raise ValueError(f'Manifest \'{path}\' has unsupported version {manifest.get("version")}')
+    return manifest
+
+
+def verify_clips(manifest, audio_folder):
+    """
+    Checks that the clips in the audio folder are the same files the plan was made with
+    :raises ValueError: If a clip differs
+    """
+    for clip in manifest['clips']:
+        if clip['fingerprint'] is None:
+            continue
+        audio_path = audio_folder + '/' + clip['audio']
+        if fingerprint_file(audio_path) != clip['fingerprint']:
+            raise ValueError(f'\'{audio_path}\' differs from the file the plan was made with')
+
+
+def load_timeline(manifest, audio_folder, audio_cache, audio_format=None):
+    """
+    :param dict manifest:
+    :param str audio_folder:
+    :param AudioCache audio_cache:
+    :param AudioFormat audio_format: Format to convert the clips to, or None
+    :return: The planned timeline, with the clips loaded from the audio folder and fitted to the
+             lengths they were planned with
+    :rtype: Timeline
+    """
+    segments = []
+    for clip in manifest['clips']:
+        audio = fit_length(audio_cache.load(audio_folder + '/' + clip['audio'], audio_format), clip['duration'])
+        segments.append(Segment(
+            clip['id'], clip['text'], clip['text_appender_symbol'], audio, None, [], [], clip['audio']
+        ))
+    return Timeline.from_columns(segments, manifest['segment_indices'], manifest['starts'], manifest['duration'])
@@ -0,0 +1,59 @@
+import json
+from time import perf_counter
+
+
+class Phase:
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.start_time = None
+
+    def __enter__(self):
+        self.start_time = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.add_time(self.name, perf_counter() - self.start_time)
+
+
+class Metrics:
+    def __init__(self, hooks=None):
+        """
+        Collects the time spent in each phase (load, decode, select, render, effects, encode,
+        transcript) and counters such as the number of picks.
+
+        Hooks are called as hook(metrics, phase) every time a phase has been timed, which allows
+        e.g. a job runner to collect the numbers while the program is running.
+        :param list hooks:
+        """
+        self.phases = {}
+        self.counters = {}
+        self.hooks = [] if hooks is None else hooks
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def phase(self, name):
+        """
+        Times a phase, e.g. `with metrics.phase('render'): ...`. If a phase is timed more than
+        once, the times add up
+        """
+        return Phase(self, name)
+
+    def add_time(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0) + seconds
+        for hook in self.hooks:
+            hook(self, name)
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def to_json(self):
+        return {
+            'phases': self.phases,
+            'counters': self.counters
+        }
+
+    def export(self, path):
+        with open(path, 'w') as handle:
+            handle.write(json.dumps(self.to_json(), indent=2))
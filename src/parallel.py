@@ -0,0 +1,84 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from src.pool import WorkerPool
+
+
+def _attach(name, shape, renderer, effect_chain, chunk_cache):
+    """
+    :return: The state of a worker: the shared output buffer and what is needed to render
+             windows of it
+    """
+    memory = shared_memory.SharedMemory(name=name)
+    samples = np.ndarray(shape, dtype=renderer.audio_format.sample_type, buffer=memory.buf)
+    return memory, samples, renderer, effect_chain, chunk_cache
+
+
+def _render_window(worker, start):
+    _, samples, renderer, effect_chain, chunk_cache = worker
+    return render_window(samples, start, renderer, effect_chain, chunk_cache)
+
+
+def render_window(samples, start, renderer, effect_chain, chunk_cache=None):
+    """
+    Renders a window of the output in place and applies the effects to it. Since the effect
+    chain only depends on the position of each sample, every window can be processed on its own.
+    :param np.ndarray samples: Zeroed buffer of the whole output
+    :param int start: Frame offset of the window, one of renderer.get_chunk_starts()
+    :param Renderer renderer:
+    :param EffectChain effect_chain:
+    :param ChunkCache chunk_cache: Optional cache from which the window is reused
+    :return: True if the window was reused from the chunk cache
+    :rtype: bool
+    """
+    window = samples[start:start + renderer.chunk_frames]
+    key = None
+    if chunk_cache is not None:
+        key = renderer.get_chunk_key(start, len(window), effect_chain)
+        cached = chunk_cache.read(key, renderer.audio_format, len(window))
+        if cached is not None:
+            window[:] = cached
+            return True
+    renderer.write(window, start)
+    processed = effect_chain.apply(window, start)
+    if processed is not window:
+        window[:] = processed
+    if key is not None:
+        chunk_cache.write(key, window)
+    return False
+
+
+class SharedOutput:
+    def __init__(self, renderer):
+        """
+        Output buffer in shared memory, which worker processes render into directly. The shared
+        memory is unlinked as soon as rendering is done; the mapping stays valid for as long as
+        this object is kept, so it has to outlive every use of the samples.
+        :param Renderer renderer:
+        """
+        audio_format = renderer.audio_format
+        self.shape = (renderer.total_frames, audio_format.channels)
+        size = renderer.total_frames * audio_format.frame_width
+        # Shared memory of size 0 can not be created
+        self.memory = shared_memory.SharedMemory(create=True, size=max(1, size))
+        # New shared memory is zero filled, which is silence
+        self.samples = np.ndarray(self.shape, dtype=audio_format.sample_type, buffer=self.memory.buf)
+        renderer.allocated += size
+
+    def render(self, renderer, effect_chain, jobs, chunk_cache=None):
+        """
+        Renders the output in windows (the chunks of the renderer) with a pool of worker
+        processes, which gives exactly the same samples as rendering it in a single process
+        :param Renderer renderer:
+        :param EffectChain effect_chain:
+        :param int jobs: Number of worker processes
+        :param ChunkCache chunk_cache: Optional cache from which windows are reused
+        :return: The number of windows that were reused from the chunk cache
+        :rtype: int
+        """
+        try:
+            with WorkerPool(jobs, _attach, self.memory.name, self.shape, renderer, effect_chain, chunk_cache) as pool:
+                return sum(pool.map(_render_window, renderer.get_chunk_starts()))
+        finally:
+            self.memory.unlink()
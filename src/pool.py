@@ -0,0 +1,50 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+# State of a worker process, set once when the process starts
+_state = None
+
+
+def _init_worker(create_state, args):
+    global _state
+    _state = create_state(*args)
+
+
+def _call(function, *args):
+    return function(_state, *args)
+
+
+class WorkerPool:
+    def __init__(self, jobs, create_state, *args):
+        """
+        Pool of worker processes that each hold a state (e.g. a loaded task or a warm audio
+        cache), which is created once when the process starts instead of being sent along with
+        every call. The state is created within the process from `args`, which only have to be
+        picklable themselves, such that this works with any start method of the processes.
+        :param int jobs: Number of worker processes
+        :param create_state: Function that creates the state of a worker from `args`
+        """
+        self.executor = ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(create_state, args))
+
+    def submit(self, function, *args):
+        """
+        Calls function(state, *args) in a worker process
+        :rtype: Future
+        """
+        return self.executor.submit(_call, function, *args)
+
+    def map(self, function, iterable, chunksize=1):
+        """
+        Calls function(state, item) in the worker processes for each item
+        :return: The results, in the order of the items
+        """
+        return self.executor.map(partial(_call, function), iterable, chunksize=chunksize)
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.executor.shutdown(wait, cancel_futures=cancel_futures)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
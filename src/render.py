@@ -0,0 +1,238 @@
+import hashlib
+
+import numpy as np
+from pydub import AudioSegment
+
+from src.util import extract
+
+# Maps the sample width (in bytes) of pydub audio to the matching numpy sample type. Pydub
+# stores 8-bit audio as signed samples and converts 24-bit audio to 32-bit when loading
+SAMPLE_TYPES = {
+    1: np.int8,
+    2: np.int16,
+    4: np.int32
+}
+
+
+def ms_to_frames(milliseconds, frame_rate):
+    return milliseconds * frame_rate // 1000
+
+
+def to_sample_type(samples, sample_type):
+    """
+    Clips (saturates) samples to the range of the given sample type and converts them to it,
+    the same way pydub (audioop) does when samples overflow
+    """
+    info = np.iinfo(sample_type)
+    return np.clip(samples, info.min, info.max).astype(sample_type)
+
+
+class AudioFormat:
+    def __init__(self, frame_rate, channels, sample_width):
+        self.frame_rate = frame_rate
+        self.channels = channels
+        self.sample_width = sample_width
+        self.frame_width = channels * sample_width
+        self.sample_type = SAMPLE_TYPES[sample_width]
+
+    def get_key(self):
+        """
+        :return: A short description of the format, for use in cache keys
+        :rtype: str
+        """
+        return f'{self.frame_rate}|{self.channels}|{self.sample_width}'
+
+    def convert(self, audio):
+        """
+        :param AudioSegment audio:
+        :return: The audio in this format
+        :rtype: AudioSegment
+        """
+        return audio.set_frame_rate(self.frame_rate).set_channels(self.channels).set_sample_width(self.sample_width)
+
+    def to_samples(self, audio):
+        """
+        :param AudioSegment audio:
+        :return: The samples of the audio in this format, with shape (frames, channels)
+        :rtype: np.ndarray
+        """
+        audio = self.convert(audio)
+        return np.frombuffer(audio.raw_data, dtype=self.sample_type).reshape(-1, self.channels)
+
+    def to_audio(self, samples):
+        """
+        :param np.ndarray samples: Samples with shape (frames, channels)
+        :return: An audio segment that reads straight from the samples instead of a copy of them
+        :rtype: AudioSegment
+        """
+        # An empty view can not be cast, and has no samples to read from anyway
+        data = b'' if samples.size == 0 else memoryview(samples).cast('B')
+        return AudioSegment(
+            data=data,
+            sample_width=self.sample_width,
+            frame_rate=self.frame_rate,
+            channels=self.channels
+        )
+
+    def to_json(self):
+        return {
+            'frame_rate': self.frame_rate,
+            'channels': self.channels,
+            'sample_width': self.sample_width
+        }
+
+    @staticmethod
+    def from_json(json):
+        frame_rate = int(json['frame_rate'])
+        channels = int(extract('channels', json, 2))
+        sample_width = int(extract('sample_width', json, 2))
+        if sample_width not in SAMPLE_TYPES:
+            raise ValueError(f'Unsupported sample width {sample_width}, use one of {list(SAMPLE_TYPES.keys())}')
+        return AudioFormat(frame_rate, channels, sample_width)
+
+    @staticmethod
+    def common(clips):
+        """
+        :param list clips: Audio segments
+        :return: The highest frame rate, channel count and sample width among the given clips,
+                 which is what pydub would convert to when appending them
+        :rtype: AudioFormat
+        """
+        if len(clips) == 0:
+            silence = AudioSegment.silent(0)
+            return AudioFormat(silence.frame_rate, silence.channels, silence.sample_width)
+        return AudioFormat(
+            max(clip.frame_rate for clip in clips),
+            max(clip.channels for clip in clips),
+            max(clip.sample_width for clip in clips)
+        )
+
+
+class Renderer:
+    def __init__(self, timeline, chunk_length=10 * 1000, audio_format=None):
+        """
+        Turns a planned timeline into audio. Every distinct clip is converted once to a common
+        format, after which the samples of each segment are written straight to its offset in
+        the output. Gaps in the timeline (breath pauses) are simply left zero, i.e. silent.
+        :param Timeline timeline:
+        :param int chunk_length: Length (in milliseconds) of the chunks in which the output is
+                                 processed
+        :param AudioFormat audio_format: Format of the output. If the clips were normalised to it
+                                         when they were loaded, they are used as they are.
+                                         None for the common format of the clips
+        """
+        # Every distinct clip is only converted once
+        clips = [segment.audio for segment in timeline.segments]
+        self.audio_format = AudioFormat.common(clips) if audio_format is None else audio_format
+        self.clips = [self.audio_format.to_samples(clip) for clip in clips]
+        # Number of bytes allocated for samples, i.e. converted clips and buffers
+        self.allocated = sum(clip.nbytes for clip in self.clips)
+
+        frame_rate = self.audio_format.frame_rate
+        self.total_frames = ms_to_frames(timeline.duration, frame_rate)
+        self.chunk_frames = max(1, ms_to_frames(chunk_length, frame_rate))
+        self.segment_indices = timeline.get_segment_indices()
+        self.offsets = ms_to_frames(timeline.get_starts(), frame_rate)
+
+        # Running maximum of the placement ends, such that the first placement that reaches
+        # into a window can be found by bisection, even if clips slightly overlap
+        lengths = np.array([len(clip) for clip in self.clips], dtype=np.int64)
+        self.reach = np.maximum.accumulate(self.offsets + lengths[self.segment_indices])
+        self.fingerprints = None
+
+    def get_placements(self, start, end):
+        """
+        :return: The (clip index, frame offset) of each placement that overlaps the frames from
+                 `start` up to `end`, in timeline order
+        :rtype: generator
+        """
+        first = np.searchsorted(self.reach, start, side='right')
+        last = np.searchsorted(self.offsets, end, side='left')
+        for position in range(first, last):
+            offset = int(self.offsets[position])
+            clip_index = int(self.segment_indices[position])
+            if offset < end and offset + len(self.clips[clip_index]) > start:
+                yield clip_index, offset
+
+    def write(self, buffer, start):
+        """
+        Writes the part of the output that starts at frame `start` and has the length of the
+        buffer. Placements are written in timeline order, such that rendering in windows gives
+        exactly the same samples as rendering everything at once.
+        :param np.ndarray buffer: Zeroed buffer with shape (frames, channels)
+        :param int start: Frame offset of the buffer in the output
+        """
+        end = start + len(buffer)
+        for clip_index, offset in self.get_placements(start, end):
+            samples = self.clips[clip_index]
+            left = max(offset, start)
+            right = min(offset + len(samples), end)
+            buffer[left - start:right - start] = samples[left - offset:right - offset]
+
+    def get_chunk_key(self, start, frames, effect_chain):
+        """
+        Content address of a processed chunk: the format, the position of the chunk, the clips
+        (by their samples) that are placed in it, where they are placed and the effects. Chunks
+        with the same key have the same samples, whichever task or run they come from.
+        :param int start: Frame offset of the chunk
+        :param int frames: Length of the chunk
+        :param EffectChain effect_chain:
+        :rtype: str
+        """
+        if self.fingerprints is None:
+            self.fingerprints = [hashlib.sha1(np.ascontiguousarray(clip)).hexdigest() for clip in self.clips]
+        description = [
+            self.audio_format.get_key(),
+            f'{start}|{frames}',
+            effect_chain.get_fingerprint()
+        ]
+        for clip_index, offset in self.get_placements(start, start + frames):
+            description.append(f'{self.fingerprints[clip_index]}|{offset - start}')
+        return hashlib.sha1('\n'.join(description).encode('utf-8')).hexdigest()
+
+    def allocate(self, frames):
+        buffer = np.zeros((frames, self.audio_format.channels), dtype=self.audio_format.sample_type)
+        self.allocated += buffer.nbytes
+        return buffer
+
+    def render(self):
+        """
+        :return: The samples of the whole output, in a single buffer of the final length
+        :rtype: np.ndarray
+        """
+        buffer = self.allocate(self.total_frames)
+        self.write(buffer, 0)
+        return buffer
+
+    def apply(self, buffer, effect_chain):
+        """
+        Applies effects to the whole output in place, chunk by chunk
+        :param np.ndarray buffer: Samples of the whole output
+        :param EffectChain effect_chain:
+        """
+        if effect_chain.is_identity():
+            return
+        for start in self.get_chunk_starts():
+            end = start + self.chunk_frames
+            buffer[start:end] = effect_chain.apply(buffer[start:end], start)
+
+    def get_chunk_starts(self, start=0, end=None):
+        """
+        :param int start: Frame offset from which to start
+        :param int end: Frame offset at which to stop, or None for the end of the output
+        :rtype: range
+        """
+        return range(start, self.total_frames if end is None else end, self.chunk_frames)
+
+    def render_chunk(self, start, end=None):
+        """
+        Renders a single chunk of the output, such that the output can be produced without ever
+        holding all of it in memory
+        :param int start: Frame offset of the chunk, one of get_chunk_starts()
+        :param int end: Frame offset at which the rendered part stops, or None for the end of the output
+        :rtype: np.ndarray
+        """
+        end = self.total_frames if end is None else end
+        buffer = self.allocate(min(self.chunk_frames, end - start))
+        self.write(buffer, start)
+        return buffer
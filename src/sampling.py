@@ -0,0 +1,97 @@
+import bisect
+import itertools
+
+
+class WeightedSampler:
+    def __init__(self, items, weights):
+        """
+        Picks items with a probability proportional to their (possibly fractional) weight,
+        by bisecting the cumulative weights
+        :param list items:
+        :param list weights:
+        """
+        self.items = items
+        self.cumulative = list(itertools.accumulate(weights))
+        self.total = self.cumulative[-1] if len(self.cumulative) > 0 else 0
+        if self.total <= 0:
+            raise ValueError('The total weight of the items must be positive')
+
+    def sample(self, uniform):
+        """
+        :param float uniform: Random value in [0, 1)
+        """
+        index = bisect.bisect_right(self.cumulative, uniform * self.total)
+        # Guard against rounding of the product to the total weight
+        return self.items[min(index, len(self.items) - 1)]
+
+
+class WeightTree:
+    def __init__(self, size):
+        """
+        Weights of a fixed number of items, kept in a binary tree of partial sums. Changing a
+        weight and picking an item with a probability proportional to its weight both take
+        O(log n). Items with a weight of 0 are never picked.
+        :param int size: Number of items, which are referred to by their index
+        """
+        self.size = 1
+        while self.size < size:
+            self.size *= 2
+        # Node i holds the sum of nodes 2i and 2i + 1, the leaves start at `size`
+        self.sums = [0] * (2 * self.size)
+
+    @property
+    def total(self):
+        return self.sums[1]
+
+    def set(self, index, weight):
+        position = index + self.size
+        if self.sums[position] == weight:
+            return
+        self.sums[position] = weight
+        position //= 2
+        while position > 0:
+            # Sums are recomputed rather than adjusted, such that fractional weights do not drift
+            self.sums[position] = self.sums[2 * position] + self.sums[2 * position + 1]
+            position //= 2
+
+    def sample(self, uniform):
+        """
+        Picks the same item as bisecting the cumulative weights (in the order of the indices)
+        would
+        :param float uniform: Random value in [0, 1)
+        :return: The index of the picked item
+        """
+        target = uniform * self.sums[1]
+        position = 1
+        while position < self.size:
+            left = self.sums[2 * position]
+            # Guard against rounding of the product to the total weight, as WeightedSampler does
+            if target < left or self.sums[2 * position + 1] <= 0:
+                position = 2 * position
+            else:
+                target -= left
+                position = 2 * position + 1
+        return position - self.size
+
+
+class UniformStream:
+    def __init__(self, generator, batch_size=1024):
+        """
+        Draws uniform random values in [0, 1) in batches. The values (and thus the picks made
+        with them) only depend on the state of the generator when the first value is drawn.
+        :param generator: Source of random values, e.g. a random.Random instance
+        :param int batch_size:
+        """
+        self.generator = generator
+        self.batch_size = batch_size
+        self.batch = []
+        self.position = 0
+
+    def next(self):
+        if self.position == len(self.batch):
+            draw = self.generator.random
+            self.batch = [draw() for _ in range(self.batch_size)]
+            self.position = 0
+        value = self.batch[self.position]
+        self.position += 1
+        return value
@@ -1,5 +1,4 @@
-from pydub import AudioSegment
-
+from src.cache import LazyAudio
 from src.timestamp import Timestamp
 from src.util import extract
 
@@ -27,16 +26,31 @@ class Section:
 
 
 class Segment:
-    def __init__(self, segment_id, text, text_appender_symbol, audio, always_occurrence, sections, timestamps):
+    def __init__(self, segment_id, text, text_appender_symbol, audio, always_occurrence, sections, timestamps,
+                 audio_name=None):
         self.id = segment_id
         self.text = text
         self.text_appender_symbol = text_appender_symbol
-        self.audio = audio
+        self.audio_source = audio
+        # Location of the audio file relative to the audio folder, if it has one
+        self.audio_name = audio_name
+        # Length in milliseconds, such that planning never has to inspect the audio itself
+        self.duration = len(audio)
         self.always_occurrence = always_occurrence
         self.sections = sections
         self.timestamps = timestamps
         self.timestamps.sort(key=lambda t: t.seconds)
 
+    @property
+    def audio(self):
+        """
+        :return: The audio of the segment, which is decoded on first use if it is loaded lazily
+        :rtype: AudioSegment
+        """
+        if isinstance(self.audio_source, LazyAudio):
+            return self.audio_source.load()
+        return self.audio_source
+
     def has_always_occurrence(self):
         return self.always_occurrence is not None
 
@@ -51,11 +65,11 @@ class Segment:
         return None
 
     @staticmethod
-    def from_json(json, audio_folder, max_time):
+    def from_json(json, audio_folder, max_time, audio_cache, audio_format=None):
         segment_id = extract('id', json, json['text'])
         text = extract('text', json)
         text_appender_symbol = extract('text_appender_symbol', json, '. ')
-        audio = AudioSegment.from_mp3(audio_folder + '/' + json['audio'])
+        audio = audio_cache.open(audio_folder + '/' + json['audio'], audio_format)
 
         always_occurrence = None
         if 'always' in json:
@@ -71,4 +85,6 @@ class Segment:
             for timestamp in json['timestamps']:
                 timestamps.append(Timestamp.from_json(timestamp, max_time))
 
-        return Segment(segment_id, text, text_appender_symbol, audio, always_occurrence, sections, timestamps)
+        return Segment(
+            segment_id, text, text_appender_symbol, audio, always_occurrence, sections, timestamps, json['audio']
+        )
@@ -1,5 +1,13 @@
 class Settings:
-    def __init__(self, seed, duration, breath_pause_length):
+    def __init__(self, seed, duration, breath_pause_length, audio_format=None):
+        """
+        :param int seed:
+        :param int duration: Duration in seconds
+        :param int breath_pause_length: Length of the pause after every segment in milliseconds
+        :param AudioFormat audio_format: Format of the output, to which all audio is converted
+                                         when it is loaded. None for the common format of the clips
+        """
         self.seed = seed
         self.duration = duration
         self.breath_pause_length = breath_pause_length
+        self.audio_format = audio_format
@@ -0,0 +1,166 @@
+import numpy as np
+
+from src.pool import WorkerPool
+
+PERCENTILES = [5, 50, 95]
+
+
+def simulate_seed(task, seed):
+    """
+    Plans a variant of the task, without rendering it. Only the durations of the segments are
+    used, so no audio is decoded.
+    :param Task task:
+    :param int seed:
+    :return: The number of picks of each segment, the picks of each section (in the order of
+             get_sections()) and the lateness (in seconds) of each forced timestamp by (segment
+             index, seconds), which is None if the timestamp was not reached in time
+    :rtype: tuple
+    """
+    variant = task.create_variant(seed)
+    variant.logger.enabled = False
+    variant.plan()
+
+    timeline = variant.result.timeline
+    positions = {id(segment): index for index, segment in enumerate(task.segments)}
+    mapping = np.array([positions[id(segment)] for segment in timeline.segments], dtype=np.intp)
+    indices = mapping[timeline.get_segment_indices()]
+    counts = np.bincount(indices, minlength=len(task.segments))
+
+    starts = timeline.get_starts()
+    section_picks = []
+    for index, section in get_sections(task):
+        in_section = (starts >= section.start.seconds * 1000) & (starts <= section.end.seconds * 1000)
+        section_picks.append(int(np.count_nonzero(in_section & (indices == index))))
+
+    selector = variant.segment_selector
+    lateness = {(index, timestamp): seconds - timestamp for index, timestamp, seconds in selector.forced_picks}
+    for index, timestamp in selector.due_timestamps:
+        lateness[(index, timestamp)] = None
+    for timestamp, index in selector.pending_timestamps:
+        lateness[(index, timestamp)] = None
+    return counts, section_picks, lateness
+
+
+def get_sections(task):
+    """
+    :return: (segment index, section) of every section of the task
+    :rtype: list
+    """
+    return [(index, section) for index, segment in enumerate(task.segments) for section in segment.sections]
+
+
+def summarise(values):
+    """
+    :param np.ndarray values: Values per seed, along the first axis
+    :rtype: dict
+    """
+    summary = {
+        'mean': values.mean(axis=0).tolist(),
+        'std': values.std(axis=0).tolist(),
+        'min': values.min(axis=0).tolist(),
+        'max': values.max(axis=0).tolist()
+    }
+    for percentile in PERCENTILES:
+        summary[f'p{percentile}'] = np.percentile(values, percentile, axis=0).tolist()
+    return summary
+
+
+def run_simulation(task, load, seeds, jobs=1):
+    """
+    Plans the task for every seed and reports the distribution of the outcome over the seeds:
+    - per segment, the number of picks
+    - per section, how often it has at least one pick of its segment ('coverage') and the
+      number of picks within it
+    - per forced timestamp, how late (in seconds) it was picked and how often it was missed,
+      i.e. not reached before the end of the output
+    :param Task task:
+    :param load: Function without arguments that loads the task again, in each worker process
+    :param list seeds:
+    :param int jobs: Number of worker processes
+    :rtype: dict
+    """
+    if len(seeds) == 0:
+        raise ValueError('At least one seed is needed to simulate')
+    if jobs <= 1:
+        results = [simulate_seed(task, seed) for seed in seeds]
+    else:
+        chunk_size = max(1, len(seeds) // (jobs * 4))
+        with WorkerPool(jobs, load) as pool:
+            results = list(pool.map(simulate_seed, seeds, chunksize=chunk_size))
+
+    # Outcomes by seed (rows) and segment or section (columns)
+    sections = get_sections(task)
+    counts = np.array([result[0] for result in results], dtype=np.int64)
+    section_picks = np.array([result[1] for result in results], dtype=np.int64).reshape(len(seeds), len(sections))
+
+    pick_summary = summarise(counts)
+    report = {
+        'seeds': len(seeds),
+        'duration': task.settings.duration,
+        'segments': [],
+        'sections': [],
+        'timestamps': []
+    }
+    for index, segment in enumerate(task.segments):
+        entry = {'index': index, 'id': segment.id}
+        entry.update({key: values[index] for key, values in pick_summary.items()})
+        report['segments'].append(entry)
+
+    for position, (index, section) in enumerate(sections):
+        picks = section_picks[:, position]
+        report['sections'].append({
+            'segment': index,
+            'id': task.segments[index].id,
+            'start': section.start.seconds,
+            'end': section.end.seconds,
+            'coverage': float(np.mean(picks > 0)),
+            'mean_picks': float(np.mean(picks))
+        })
+
+    for index, segment in enumerate(task.segments):
+        for timestamp in segment.timestamps:
+            lateness = []
+            missed = 0
+            for result in results:
+                value = result[2].get((index, timestamp.seconds))
+                if value is None:
+                    missed += 1
+                else:
+                    lateness.append(value)
+            entry = {'segment': index, 'id': segment.id, 'seconds': timestamp.seconds, 'missed': missed}
+            if len(lateness) > 0:
+                entry.update(summarise(np.array(lateness)))
+            report['timestamps'].append(entry)
+    return report
+
+
+def format_report(report):
+    """
+    :return: The report as a human readable table
+    :rtype: str
+    """
+    lines = [f'Simulated {report["seeds"]} seeds of {report["duration"]}s', '', 'Picks per segment']
+    lines.append(f'{"segment":<24}{"mean":>10}{"std":>10}{"min":>8}{"p5":>8}{"p50":>8}{"p95":>8}{"max":>8}')
+    for entry in report['segments']:
+        lines.append(
+            f'{str(entry["id"])[:23]:<24}{entry["mean"]:>10.2f}{entry["std"]:>10.2f}{entry["min"]:>8}'
+            f'{entry["p5"]:>8.0f}{entry["p50"]:>8.0f}{entry["p95"]:>8.0f}{entry["max"]:>8}'
+        )
+    if len(report['sections']) > 0:
+        lines += ['', 'Sections']
+        lines.append(f'{"segment":<24}{"start":>10}{"end":>10}{"coverage":>10}{"picks":>10}')
+        for entry in report['sections']:
+            lines.append(
+                f'{str(entry["id"])[:23]:<24}{entry["start"]:>10.1f}{entry["end"]:>10.1f}'
+                f'{entry["coverage"]:>10.1%}{entry["mean_picks"]:>10.2f}'
+            )
+    if len(report['timestamps']) > 0:
+        lines += ['', 'Forced timestamps (lateness in seconds)']
+        lines.append(f'{"segment":<24}{"at":>10}{"p50":>10}{"p95":>10}{"max":>10}{"missed":>10}')
+        for entry in report['timestamps']:
+            if 'mean' in entry:
+                lateness = f'{entry["p50"]:>10.2f}{entry["p95"]:>10.2f}{entry["max"]:>10.2f}'
+            else:
+                lateness = f'{"-":>10}{"-":>10}{"-":>10}'
+            lines.append(f'{str(entry["id"])[:23]:<24}{entry["seconds"]:>10.1f}{lateness}{entry["missed"]:>10}')
+    return '\n'.join(lines)
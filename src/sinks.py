@@ -0,0 +1,472 @@
+import hashlib
+import struct
+import subprocess
+import tempfile
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+from pydub import AudioSegment
+from pydub.exceptions import CouldntEncodeError
+
+# Raw PCM sample formats of ffmpeg, by sample width (in bytes)
+FFMPEG_SAMPLE_FORMATS = {
+    1: 's8',
+    2: 's16le',
+    4: 's32le'
+}
+# Size of the header of a WAV file, up to its audio: the RIFF header and a JUNK (or ds64), fmt and
+# data chunk
+WAV_HEADER_SIZE = 12 + 36 + 24 + 8
+
+
+class Sink:
+    def write(self, samples):
+        """
+        :param np.ndarray samples: Next chunk of the output with shape (frames, channels)
+        """
+        pass
+
+    def close(self):
+        pass
+
+
+class RawSink(Sink):
+    def __init__(self, path, audio_format):
+        """
+        Writes the bare samples (signed, little endian, interleaved channels) without any header
+        :param str path:
+        :param AudioFormat audio_format:
+        """
+        self.handle = open(path, 'wb')
+
+    def write(self, samples):
+        self.handle.write(samples.tobytes())
+
+    def close(self):
+        self.handle.close()
+
+
+def get_wav_header(audio_format, data_size):
+    """
+    Header of a WAV file of which the audio takes up `data_size` bytes. It is a RIFF header with
+    a JUNK chunk, unless the sizes do not fit in its 32 bit fields (4GB of audio), in which case
+    it is an RF64 header (EBU Tech 3306) of the same length, with the sizes in a ds64 chunk in
+    place of the JUNK chunk
+    :param AudioFormat audio_format:
+    :param int data_size:
+    :rtype: bytes
+    """
+    riff_size = WAV_HEADER_SIZE - 8 + data_size + data_size % 2
+    fmt = struct.pack(
+        '<HHIIHH',
+        1,
+        audio_format.channels,
+        audio_format.frame_rate,
+        audio_format.frame_rate * audio_format.frame_width,
+        audio_format.frame_width,
+        audio_format.sample_width * 8
+    )
+    if riff_size < 0xFFFFFFFF:
+        riff = struct.pack('<4sI4s', b'RIFF', riff_size, b'WAVE')
+        junk = struct.pack('<4sI', b'JUNK', 28) + bytes(28)
+    else:
+        riff = struct.pack('<4sI4s', b'RF64', 0xFFFFFFFF, b'WAVE')
+        frame_count = data_size // audio_format.frame_width
+        junk = struct.pack('<4sIQQQI', b'ds64', 28, riff_size, data_size, frame_count, 0)
+        data_size = 0xFFFFFFFF
+    return riff + junk + struct.pack('<4sI', b'fmt ', len(fmt)) + fmt + struct.pack('<4sI', b'data', data_size)
+
+
+def read_wav_header(handle):
+    """
+    Reads the header of a RIFF or RF64 WAV file with PCM samples, up to the start of its audio
+    :param handle: File opened for reading in binary mode, at its start
+    :return: The number of channels, the sample width (in bytes), the frame rate and the size
+             of the audio (in bytes)
+    :rtype: tuple
+    """
+    riff, _, wave_id = struct.unpack('<4sI4s', handle.read(12))
+    if riff not in [b'RIFF', b'RF64'] or wave_id != b'WAVE':
+        raise ValueError('Not a WAV file')
+    fmt = None
+    ds64_data_size = None
+    while True:
+        header = handle.read(8)
+        if len(header) < 8:
+            raise ValueError('WAV file without audio')
+        chunk_id, size = struct.unpack('<4sI', header)
+        if chunk_id == b'data':
+            if fmt is None:
+                raise ValueError('WAV file without a format')
+            if size == 0xFFFFFFFF and ds64_data_size is not None:
+                size = ds64_data_size
+            return fmt[0], fmt[1], fmt[2], size
+        body = handle.read(size + size % 2)
+        if chunk_id == b'fmt ':
+            format_tag, channels, frame_rate, _, _, bits = struct.unpack('<HHIIHH', body[:16])
+            if format_tag != 1:
+                raise ValueError(f'WAV files with format {format_tag} are not supported, only PCM')
+            fmt = (channels, bits // 8, frame_rate)
+        elif chunk_id == b'ds64':
+            _, ds64_data_size = struct.unpack('<QQ', body[:16])
+
+
+class WavSink(Sink):
+    def __init__(self, path, audio_format):
+        """
+        Writes a WAV file. The header is written again once the size of the audio is known,
+        which gives outputs of more than 4GB (e.g. 6.7 hours of 44.1kHz 16-bit stereo audio) an
+        RF64 header, as the sizes in a RIFF header are limited to 32 bits
+        :param str path:
+        :param AudioFormat audio_format:
+        """
+        self.handle = open(path, 'wb')
+        self.audio_format = audio_format
+        self.data_size = 0
+        self.handle.write(get_wav_header(audio_format, 0))
+
+    def write(self, samples):
+        if samples.dtype == np.int8:
+            # 8-bit WAV files store unsigned samples
+            samples = (samples.astype(np.int16) + 128).astype(np.uint8)
+        self.write_bytes(samples.tobytes())
+
+    def write_bytes(self, data):
+        """
+        :param bytes data: Samples as they are stored in the file
+        """
+        self.handle.write(data)
+        self.data_size += len(data)
+
+    def close(self):
+        try:
+            if self.data_size % 2 == 1:
+                self.handle.write(b'\0')
+            self.handle.seek(0)
+            self.handle.write(get_wav_header(self.audio_format, self.data_size))
+        finally:
+            self.handle.close()
+
+
+class FfmpegSink(Sink):
+    def __init__(self, path, audio_format):
+        """
+        Pipes the samples into ffmpeg, which encodes them in the format of the file extension
+        :param str path:
+        :param AudioFormat audio_format:
+        """
+        command = [
+            AudioSegment.converter, '-y',
+            '-f', FFMPEG_SAMPLE_FORMATS[audio_format.sample_width],
+            '-ar', str(audio_format.frame_rate),
+            '-ac', str(audio_format.channels),
+            '-i', 'pipe:0',
+            path
+        ]
+        # Errors go to a file rather than a pipe, which could fill up and block ffmpeg
+        self.errors = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=self.errors)
+
+    def write(self, samples):
+        self.process.stdin.write(samples.tobytes())
+
+    def close(self):
+        self.process.stdin.close()
+        return_code = self.process.wait()
+        self.errors.seek(0)
+        error = self.errors.read()
+        self.errors.close()
+        if return_code != 0:
+            raise CouldntEncodeError(f'Encoding failed. ffmpeg returned the error: {error.decode(errors="replace")}')
+
+
+# Number of samples (per channel) in an MP3 frame. Frames at sample rates below 32kHz (MPEG-2)
+# hold half as many, so chunks cut at multiples of this line up with frames at any sample rate
+MP3_FRAME_LENGTH = 1152
+# Number of samples by which LAME delays the audio. A stream starts with this delay, followed
+# by the samples of the input, and is padded to a whole number of frames
+MP3_ENCODER_DELAY = 576
+# Number of frames of the neighbouring chunks that a chunk is encoded with, before and after it
+MP3_CONTEXT_FRAMES = 2
+# Bit rates (in kbit/s) of layer III, by MPEG version (1, or 2 and 2.5) and bit rate index
+MP3_BIT_RATES = {
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160]
+}
+# Sample rates by the version bits of the frame header (2.5, reserved, 2 or 1) and sample rate index
+MP3_FRAME_RATES = {
+    0: [11025, 12000, 8000],
+    2: [22050, 24000, 16000],
+    3: [44100, 48000, 32000]
+}
+# Size of the Xing and LAME tags of a gapless header, from the start of the Xing tag
+MP3_TAG_SIZE = 156
+
+
+def crc16(data, crc=0):
+    """
+    CRC-16 (ARC), as used by the LAME tag
+    :param bytes data:
+    :param int crc: CRC of preceding data
+    :rtype: int
+    """
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+    return crc
+
+
+def parse_mp3_header(header):
+    """
+    :param int header: The first four bytes of a layer III frame, big endian
+    :return: The length of the frame in bytes, the number of samples in the frame and the size
+             of its side information
+    :rtype: tuple
+    """
+    if header >> 21 != 0x7FF or (header >> 17) & 3 != 1:
+        raise CouldntEncodeError(f'Invalid MP3 frame header {header:08x}')
+    version = (header >> 19) & 3
+    mpeg1 = version == 3
+    bit_rate = MP3_BIT_RATES[1 if mpeg1 else 2][(header >> 12) & 15] * 1000
+    frame_rate = MP3_FRAME_RATES[version][(header >> 10) & 3]
+    padding = (header >> 9) & 1
+    samples = 1152 if mpeg1 else 576
+    mono = (header >> 6) & 3 == 3
+    side_info = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+    return samples // 8 * bit_rate // frame_rate + padding, samples, side_info
+
+
+def split_mp3_frames(data):
+    """
+    :param bytes data: Bare stream of layer III frames
+    :return: The frames of the stream
+    :rtype: list
+    """
+    frames = []
+    position = 0
+    while position < len(data):
+        length, _, _ = parse_mp3_header(int.from_bytes(data[position:position + 4], 'big'))
+        frames.append(data[position:position + length])
+        position += length
+    return frames
+
+
+def encode_mp3(data, audio_format):
+    """
+    Encodes a chunk of samples to a bare stream of MP3 frames. The bit reservoir is disabled, such
+    that every frame can be decoded on its own, and no headers or tags are written, such that the
+    streams of consecutive chunks can be concatenated.
+    :param bytes data:
+    :param AudioFormat audio_format:
+    :rtype: bytes
+    """
+    command = [
+        AudioSegment.converter, '-y',
+        '-f', FFMPEG_SAMPLE_FORMATS[audio_format.sample_width],
+        '-ar', str(audio_format.frame_rate),
+        '-ac', str(audio_format.channels),
+        '-i', 'pipe:0',
+        '-f', 'mp3',
+        '-reservoir', '0',
+        '-write_xing', '0',
+        '-id3v2_version', '0',
+        'pipe:1'
+    ]
+    process = subprocess.run(command, input=data, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if process.returncode != 0:
+        error = process.stderr.decode(errors='replace')
+        raise CouldntEncodeError(f'Encoding failed. ffmpeg returned the error: {error}')
+    return process.stdout
+
+
+def encode_mp3_chunk(data, audio_format, preroll=b'', postroll=b'', last=False):
+    """
+    Encodes a chunk of samples together with the samples before (preroll) and after it
+    (postroll), and keeps only the frames that cover the chunk itself. As the preroll starts at a
+    multiple of the frame length, the frames line up with those of an encode of the whole output
+    (each shifted by the same encoder delay), and the context gives the frames at the edges of
+    the chunk the neighbouring samples they overlap with. Since every frame decodes on its own,
+    the frames of consecutive chunks join without seams.
+    :param bytes data: Samples of the chunk, a multiple of the frame length unless it is the last
+    :param AudioFormat audio_format:
+    :param bytes preroll: Samples before the chunk, a multiple of the frame length
+    :param bytes postroll: Samples after the chunk
+    :param bool last: If True, the chunk ends the output and the frames that flush the encoder
+                      (which cover its delay) are kept as well
+    :rtype: bytes
+    """
+    frames = split_mp3_frames(encode_mp3(preroll + data + postroll, audio_format))
+    if len(frames) == 0:
+        return b''
+    _, samples, _ = parse_mp3_header(int.from_bytes(frames[0][:4], 'big'))
+    frame_size = samples * audio_format.frame_width
+    first = len(preroll) // frame_size
+    end = len(frames) if last else first + len(data) // frame_size
+    return b''.join(frames[first:end])
+
+
+def get_gapless_header(first_frame, frame_count, byte_count, sample_count):
+    """
+    Builds a frame without audio that carries a Xing ('Info') and LAME tag, which tell decoders
+    how many frames the stream has and how many samples of encoder delay and padding to trim
+    :param bytes first_frame: The first audio frame of the stream
+    :param int frame_count: Number of audio frames
+    :param int byte_count: Size of the audio frames, in bytes
+    :param int sample_count: Number of samples (per channel) that were encoded
+    :rtype: bytes
+    """
+    # A frame without padding or CRC, at the lowest bit rate at which the tags fit in it
+    header = (int.from_bytes(first_frame[:4], 'big') & ~(1 << 9)) | (1 << 16)
+    length, samples, side_info = parse_mp3_header(header)
+    while length < 4 + side_info + MP3_TAG_SIZE:
+        header += 1 << 12
+        length, samples, side_info = parse_mp3_header(header)
+    padding = frame_count * samples - MP3_ENCODER_DELAY - sample_count
+    total = byte_count + length
+
+    frame = bytearray(length)
+    frame[:4] = header.to_bytes(4, 'big')
+    tag = bytearray()
+    tag += b'Info'
+    # The tag holds the number of frames and bytes, the table of contents and the quality
+    tag += (0xF).to_bytes(4, 'big')
+    tag += frame_count.to_bytes(4, 'big')
+    tag += total.to_bytes(4, 'big')
+    # Constant bit rate, so the table of contents is linear
+    tag += bytes(min(255, index * 256 // 100) for index in range(100))
+    tag += bytes(4)
+    tag += b'LAME3.100'
+    # Version, low pass, replay gain, flags and ABR rate are left unset
+    tag += bytes(1 + 1 + 8 + 1 + 1)
+    tag += ((MP3_ENCODER_DELAY << 12) | max(0, min(padding, 0xFFF))).to_bytes(3, 'big')
+    # Miscellaneous, MP3 gain and preset
+    tag += bytes(1 + 1 + 2)
+    tag += total.to_bytes(4, 'big')
+    # CRC of the audio, which decoders do not check, so it is left unset
+    tag += bytes(2)
+    frame[4 + side_info:4 + side_info + len(tag)] = tag
+    end = 4 + side_info + len(tag)
+    frame[end:end + 2] = crc16(frame[:end]).to_bytes(2, 'big')
+    return bytes(frame)
+
+
+class ParallelMp3Sink(Sink):
+    def __init__(self, path, audio_format, jobs=2, chunk_frames=MP3_FRAME_LENGTH * 1024, chunk_cache=None,
+                 preroll=None, postroll=None):
+        """
+        Encodes the output in chunks, with up to `jobs` ffmpeg processes at a time, and joins
+        the MP3 frames of the chunks in order. Chunks are cut at multiples of the MP3 frame length
+        and encoded with a few frames of their neighbours (see encode_mp3_chunk), so the stream
+        has no seams and has the same length and timing as a single encode. A whole output starts
+        with a gapless header, such that decoders trim the encoder delay and padding. A slice of
+        an output (with a preroll or postroll) is a bare stream of frames, which can be joined
+        with the other slices, though without a gapless header.
+        :param str path:
+        :param AudioFormat audio_format:
+        :param int jobs: Number of chunks that are encoded at the same time
+        :param int chunk_frames: Length of a chunk, rounded to a multiple of the MP3 frame length
+        :param ChunkCache chunk_cache: Optional cache of encoded chunks, by the hash of their samples
+        :param np.ndarray preroll: Samples before a slice, ending at its start, which has to be a
+                                   multiple of the MP3 frame length
+        :param np.ndarray postroll: Samples after a slice, starting at its end, which has to be a
+                                    multiple of the MP3 frame length
+        """
+        self.handle = open(path, 'wb')
+        self.audio_format = audio_format
+        self.jobs = jobs
+        self.chunk_size = max(1, chunk_frames // MP3_FRAME_LENGTH) * MP3_FRAME_LENGTH * audio_format.frame_width
+        self.context_size = MP3_CONTEXT_FRAMES * MP3_FRAME_LENGTH * audio_format.frame_width
+        self.gapless = preroll is None and postroll is None
+        self.preroll = b'' if preroll is None else np.ascontiguousarray(preroll).tobytes()[-self.context_size:]
+        self.postroll = None if postroll is None else np.ascontiguousarray(postroll).tobytes()[:self.context_size]
+        # Samples that are not submitted yet, starting at the next chunk
+        self.buffer = bytearray()
+        # The encoders run in their own processes, so threads suffice to wait for them
+        self.executor = ThreadPoolExecutor(max_workers=jobs)
+        self.chunk_cache = chunk_cache
+        self.pending = deque()
+        self.sample_count = 0
+        self.frame_count = 0
+        self.byte_count = 0
+        self.first_frame = None
+
+    def write(self, samples):
+        if samples.size == 0:
+            return
+        data = memoryview(np.ascontiguousarray(samples)).cast('B')
+        self.sample_count += len(data) // self.audio_format.frame_width
+        position = 0
+        # A chunk is submitted once the samples after it (its postroll) are there as well
+        while len(self.buffer) + len(data) - position >= self.chunk_size + self.context_size:
+            taken = self.chunk_size + self.context_size - len(self.buffer)
+            window = self.buffer + data[position:position + taken]
+            self.submit(bytes(window[:self.chunk_size]), bytes(window[self.chunk_size:]))
+            self.buffer = window[self.chunk_size:]
+            position += taken
+        self.buffer += data[position:]
+
+    def submit(self, data, postroll, last=False):
+        preroll = self.preroll
+        self.preroll = (preroll + data)[-self.context_size:]
+        # Chunks with the same samples (and context) encode to the same frames, so they can be
+        # reused from the cache
+        key = None if self.chunk_cache is None else self.get_key(preroll, data, postroll, last)
+        encoded = None if key is None else self.chunk_cache.read_bytes(key, 'mp3')
+        if encoded is not None:
+            future = Future()
+            future.set_result(encoded)
+            self.pending.append((None, future))
+        else:
+            future = self.executor.submit(encode_mp3_chunk, data, self.audio_format, preroll, postroll, last)
+            self.pending.append((key, future))
+        # Bound the number of chunks in memory, by writing finished chunks as soon as possible
+        while len(self.pending) > 2 * self.jobs:
+            self.write_next()
+
+    def get_key(self, preroll, data, postroll, last):
+        key = hashlib.sha1(f'{self.audio_format.get_key()}|{len(preroll)}|{len(postroll)}|{last}|'.encode('utf-8'))
+        key.update(preroll)
+        key.update(data)
+        key.update(postroll)
+        return key.hexdigest()
+
+    def write_next(self):
+        key, future = self.pending.popleft()
+        encoded = future.result()
+        if key is not None:
+            self.chunk_cache.write_bytes(key, 'mp3', encoded)
+        if self.gapless and len(encoded) > 0:
+            frames = split_mp3_frames(encoded)
+            if self.first_frame is None:
+                # Room for the gapless header, which is written once the stream is complete
+                self.first_frame = frames[0]
+                self.handle.write(get_gapless_header(self.first_frame, 0, 0, 0))
+            self.frame_count += len(frames)
+            self.byte_count += len(encoded)
+        self.handle.write(encoded)
+
+    def close(self):
+        try:
+            if len(self.buffer) > 0 or self.postroll is not None:
+                self.submit(bytes(self.buffer), b'' if self.postroll is None else self.postroll, self.postroll is None)
+                self.buffer = bytearray()
+            while len(self.pending) > 0:
+                self.write_next()
+            if self.first_frame is not None:
+                self.handle.seek(0)
+                self.handle.write(get_gapless_header(
+                    self.first_frame, self.frame_count, self.byte_count, self.sample_count
+                ))
+        finally:
+            self.executor.shutdown()
+            self.handle.close()
+
+
+SINKS = {
+    'mp3': FfmpegSink,
+    'flac': FfmpegSink,
+    'wav': WavSink,
+    'pcm': RawSink
+}
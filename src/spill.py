@@ -0,0 +1,63 @@
+import mmap
+import tempfile
+
+import numpy as np
+
+
+def get_peak_memory(renderer, effect_chain):
+    """
+    :return: Estimate of the memory (in bytes) needed to render the whole output in memory: the
+             converted clips, the output itself, the effect layers and the temporary (float)
+             copies of a chunk while the effects are applied
+    :rtype: int
+    """
+    audio_format = renderer.audio_format
+    output = renderer.total_frames * audio_format.frame_width
+    layers = sum(layer.nbytes for layer in effect_chain.layers)
+    working = 2 * renderer.chunk_frames * audio_format.channels * np.dtype(np.float64).itemsize
+    return renderer.allocated + output + layers + working
+
+
+class SpillFile:
+    def __init__(self, renderer, directory=None):
+        """
+        Output buffer in a memory-mapped temporary file, for outputs that do not fit in the
+        memory budget. Regions of the output that are done with are released from memory, after
+        which they only live in the file and are read back through the mapping when used again.
+        The file has no name and is removed by the system once the samples are no longer used.
+        :param Renderer renderer:
+        :param str directory: Directory of the temporary file, or None for the default
+        """
+        self.audio_format = renderer.audio_format
+        self.chunk_frames = renderer.chunk_frames
+        size = renderer.total_frames * self.audio_format.frame_width
+        self.file = tempfile.TemporaryFile(dir=directory)
+        # A mapping can not be empty. The extended file reads as zeros, which is silence
+        self.file.truncate(max(1, size))
+        self.mapping = mmap.mmap(self.file.fileno(), max(1, size))
+        sample_count = size // self.audio_format.sample_width
+        samples = np.frombuffer(self.mapping, dtype=self.audio_format.sample_type, count=sample_count)
+        self.samples = samples.reshape(-1, self.audio_format.channels)
+
+    def release(self, start, end):
+        """
+        Drops the pages of the frames from `start` up to `end` from memory. Their samples are
+        kept in the file, so they can still be read.
+        """
+        if not hasattr(mmap, 'MADV_DONTNEED'):
+            # The pages are backed by the file either way, so the system can still drop them
+            return
+        frame_width = self.audio_format.frame_width
+        first = -(-start * frame_width // mmap.PAGESIZE) * mmap.PAGESIZE
+        last = end * frame_width // mmap.PAGESIZE * mmap.PAGESIZE
+        if first < last:
+            self.mapping.madvise(mmap.MADV_DONTNEED, first, last - first)
+
+    def read_chunks(self):
+        """
+        :return: Generator of the chunks of the output, each released once the next is read
+        """
+        for start in range(0, len(self.samples), self.chunk_frames):
+            end = start + self.chunk_frames
+            yield self.samples[start:end]
+            self.release(start, end)
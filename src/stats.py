@@ -1,8 +1,18 @@
 class Stats:
-    def __init__(self):
-        self.histogram = {}
+    def __init__(self, timeline):
+        """
+        :param Timeline timeline:
+        """
+        self.timeline = timeline
 
-    def record_segment(self, segment):
-        if segment.id not in self.histogram:
-            self.histogram[segment.id] = 0
-        self.histogram[segment.id] += 1
+    @property
+    def histogram(self):
+        """
+        :return: The number of picks by segment id, in the order in which the segments were
+                 first picked
+        :rtype: dict
+        """
+        histogram = {}
+        for segment, count in zip(self.timeline.segments, self.timeline.get_counts()):
+            histogram[segment.id] = histogram.get(segment.id, 0) + int(count)
+        return histogram
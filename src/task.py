@@ -2,66 +2,209 @@ import random
 from time import time
 
 from src.SegmentSelector import SegmentSelector
+from src.effect import EffectChain
 from src.logger import Logger
+from src.metrics import Metrics
+from src.parallel import SharedOutput
+from src.render import Renderer
 from src.result import Result
+from src.settings import Settings
+from src.spill import SpillFile, get_peak_memory
 
 
 class Task:
-    def __init__(self, segments, settings, segment_generator, effects):
+    def __init__(self, segments, settings, segment_generator, effects, metrics=None):
         self.segments = segments
         self.settings = settings
+        self.segment_generator = segment_generator
         self.breath_pause = segment_generator.generate_breath_pause()
         self.effects = effects
-        self.segment_selector = SegmentSelector(segments)
+        # Every task has its own generator, such that tasks do not influence each other
+        self.random = random.Random(self.settings.seed)
+        self.segment_selector = SegmentSelector(segments, self.random)
         self.logger = Logger()
+        self.metrics = Metrics() if metrics is None else metrics
+        # Optional ChunkCache, from which chunks that were rendered before are reused
+        self.chunk_cache = None
+        # Optional memory budget (in bytes) for rendering, beyond which the output is spilled to disk
+        self.max_memory = None
         self.result = Result()
-        self.init()
 
-    def init(self):
-        random.seed(self.settings.seed)
+    def create_variant(self, seed):
+        """
+        :param int seed:
+        :return: A new task with the same segments and effects, but a different seed
+        :rtype: Task
+        """
+        settings = Settings(
+            seed,
+            self.settings.duration,
+            self.settings.breath_pause_length,
+            self.settings.audio_format
+        )
+        metrics = Metrics(self.metrics.hooks)
+        variant = Task(self.segments, settings, self.segment_generator, self.effects, metrics)
+        variant.chunk_cache = self.chunk_cache
+        variant.max_memory = self.max_memory
+        return variant
 
-    def preview(self):
+    def plan_preview(self):
         for segment in self.segments:
             self.result.add_segment(segment)
-            self.result.add_segment(self.breath_pause, is_silence=True, record_stats=False)
+            self.result.add_segment(self.breath_pause, is_silence=True)
+
+    def preview(self):
+        self.plan_preview()
         self.finalise()
 
-    def finalise(self):
+    def finalise(self, jobs=1):
+        """
+        Renders the planned timeline and applies the effects to it, in a single pass. If that
+        would take more memory than the budget, the output is rendered into a temporary file
+        chunk by chunk instead, of which only the chunk being rendered is held in memory
+        :param int jobs: Number of worker processes that render windows of the output into
+                         shared memory, the output is the same for any number
+        """
         start_time = time()
-        total = len(self.result.parts) + len(self.effects)
-        progress = 1
-        for part in self.result.parts:
-            self.result.audio += part
-            elapsed_time = round(time() - start_time, 2)
-            self.logger.print_progress(progress, total, suffix=f'Finalising ({elapsed_time}s)', bar_length=32)
-            progress += 1
-        for effect in self.effects:
-            effect.post_finalise(self.result)
-            elapsed_time = round(time() - start_time, 2)
-            self.logger.print_progress(progress, total, suffix=f'Finalising ({elapsed_time}s)', bar_length=32)
-            progress += 1
+        with self.metrics.phase('render'):
+            renderer = Renderer(self.result.timeline, audio_format=self.settings.audio_format)
+        with self.metrics.phase('effects'):
+            effect_chain = EffectChain(self.effects, renderer.audio_format)
+        peak_memory = get_peak_memory(renderer, effect_chain)
+        spill = self.max_memory is not None and peak_memory > self.max_memory
+        if jobs > 1 and not spill:
+            with self.metrics.phase('render'):
+                output = SharedOutput(renderer)
+                reused = output.render(renderer, effect_chain, jobs, self.chunk_cache)
+            samples = output.samples
+            # The audio reads straight from the shared memory, which has to stay mapped
+            self.result.storage = output
+            if self.chunk_cache is not None:
+                self.metrics.count('chunks_reused', reused)
+                self.metrics.count('chunks_rendered', len(renderer.get_chunk_starts()) - reused)
+        elif self.chunk_cache is None and not spill:
+            with self.metrics.phase('render'):
+                samples = renderer.render()
+            with self.metrics.phase('effects'):
+                renderer.apply(samples, effect_chain)
+        else:
+            with self.metrics.phase('render'):
+                if spill:
+                    output = SpillFile(renderer)
+                    samples = output.samples
+                    self.result.storage = output
+                    self.metrics.count('bytes_spilled', samples.nbytes)
+                else:
+                    samples = renderer.allocate(renderer.total_frames)
+            for position in renderer.get_chunk_starts():
+                chunk = samples[position:position + renderer.chunk_frames]
+                if self.chunk_cache is not None:
+                    processed = self.process_chunk(renderer, effect_chain, position, chunk)
+                else:
+                    with self.metrics.phase('render'):
+                        renderer.write(chunk, position)
+                    with self.metrics.phase('effects'):
+                        processed = effect_chain.apply(chunk, position)
+                if processed is not chunk:
+                    chunk[:] = processed
+                if spill:
+                    output.release(position, position + len(chunk))
+        self.result.audio = renderer.audio_format.to_audio(samples)
+        self.metrics.count('bytes_allocated', renderer.allocated)
+        elapsed_time = round(time() - start_time, 2)
+        self.logger.print_progress(1, 1, suffix=f'Finalising ({elapsed_time}s)', bar_length=32)
 
-    def execute(self):
-        start_time = time()
-        while self.result.get_duration_in_seconds() < self.settings.duration:
-            segment = self.segment_selector.get_segment(self.result)
-            self.result.add_segment(segment)
-            self.result.add_segment(self.breath_pause, is_silence=True, record_stats=False)
+    def process_chunk(self, renderer, effect_chain, position, buffer):
+        """
+        Renders a chunk and applies the effects to it, unless the chunk cache already holds it
+        :param Renderer renderer:
+        :param EffectChain effect_chain:
+        :param int position: Frame offset of the chunk
+        :param np.ndarray buffer: Zeroed buffer of the length of the chunk
+        :return: The processed chunk
+        :rtype: np.ndarray
+        """
+        with self.metrics.phase('render'):
+            key = renderer.get_chunk_key(position, len(buffer), effect_chain)
+            cached = self.chunk_cache.read(key, renderer.audio_format, len(buffer))
+        if cached is not None:
+            self.metrics.count('chunks_reused')
+            return cached
+        with self.metrics.phase('render'):
+            renderer.write(buffer, position)
+        with self.metrics.phase('effects'):
+            samples = effect_chain.apply(buffer, position)
+        self.chunk_cache.write(key, samples)
+        self.metrics.count('chunks_rendered')
+        return samples
 
-            # Calculate current progress
-            length = self.result.get_duration_in_seconds()
-            total = self.settings.duration
-            elapsed_time = round(time() - start_time, 2)
+    def plan(self):
+        """
+        Selects all segments of the result and places them on the timeline. No audio is touched
+        here, the current time is an integer millisecond counter on the timeline
+        """
+        start_time = time()
+        total = self.settings.duration * 1000
+        with self.metrics.phase('select'):
+            while self.result.timeline.duration < total:
+                segment = self.segment_selector.get_segment(self.result)
+                self.result.add_segment(segment)
+                self.result.add_segment(self.breath_pause, is_silence=True)
 
-            self.logger.print_progress(length, total, suffix=f'Creating sample ({elapsed_time}s)', bar_length=32)
+                # Calculate current progress, only when the bar is redrawn
+                length = self.result.timeline.duration
+                if self.logger.is_due(length, total):
+                    elapsed_time = round(time() - start_time, 2)
+                    suffix = f'Creating sample ({elapsed_time}s)'
+                    self.logger.print_progress(length, total, suffix=suffix, bar_length=32)
+        self.metrics.count('picks', self.segment_selector.picks)
+        self.metrics.count('relaxations', self.segment_selector.relaxations)
 
         # Add the remaining segments that still have a timestamp
-        for segment in self.segments:
-            if len(segment.timestamps) > 0:
-                self.result.add_segment(segment)
-                self.result.add_segment(self.breath_pause, is_silence=True, record_stats=False)
+        for segment in self.segment_selector.get_pending_segments():
+            self.result.add_segment(segment)
+            self.result.add_segment(self.breath_pause, is_silence=True)
 
         elapsed_time = round(time() - start_time, 2)
         self.logger.print_progress(1, 1, suffix=f'Done ({elapsed_time}s)', bar_length=32)
 
+    def execute(self):
+        self.plan()
         self.finalise()
+
+    def stream(self, sink_type, path):
+        """
+        Alternative to finalise(), which renders the planned timeline in chunks and passes each
+        chunk through the effects into a sink. Only a single chunk of the output is held in
+        memory at a time, regardless of the duration.
+        :param type sink_type: Sink class, e.g. WavSink
+        :param str path: Location of the created file
+        """
+        start_time = time()
+        with self.metrics.phase('render'):
+            renderer = Renderer(self.result.timeline, audio_format=self.settings.audio_format)
+        with self.metrics.phase('effects'):
+            effect_chain = EffectChain(self.effects, renderer.audio_format)
+        sink = sink_type(path, renderer.audio_format)
+        try:
+            for position in renderer.get_chunk_starts():
+                if self.chunk_cache is None:
+                    with self.metrics.phase('render'):
+                        samples = renderer.render_chunk(position)
+                    with self.metrics.phase('effects'):
+                        samples = effect_chain.apply(samples, position)
+                else:
+                    frames = min(renderer.chunk_frames, renderer.total_frames - position)
+                    samples = self.process_chunk(renderer, effect_chain, position, renderer.allocate(frames))
+                with self.metrics.phase('encode'):
+                    sink.write(samples)
+
+                progress = position + len(samples)
+                total = renderer.total_frames
+                if self.logger.is_due(progress, total):
+                    elapsed_time = round(time() - start_time, 2)
+                    self.logger.print_progress(progress, total, suffix=f'Streaming ({elapsed_time}s)', bar_length=32)
+        finally:
+            with self.metrics.phase('encode'):
+                sink.close()
+        self.metrics.count('bytes_allocated', renderer.allocated)
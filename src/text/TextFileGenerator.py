@@ -1,4 +1,5 @@
 import datetime
+import io
 import math
 
 from src.util import rpad_string, lrpad_string
@@ -25,15 +26,29 @@ class TranscriptFileGenerator:
         return f'{minutes}m{seconds}s' if minutes > 0 else f'{seconds}s'
 
     def compile(self):
+        handle = io.StringIO()
+        self.write(handle)
+        return handle.getvalue()
+
+    def write(self, handle):
+        """
+        Writes the transcript to a file handle. The text of the segments is wrapped and written
+        as it is read from the result, such that the transcript is never held in memory as a whole
+        :param handle: Writable text file handle
+        """
         file_info = {
             'date': datetime.date.today(),
             'duration': self.get_duration_as_string()
         }
         meta = {**self.meta, **file_info}
-        text = (ConstrainedWidthTextTemplate(self.result.text_string, 100)).compile()
         meta_text = (PropertiesTextTemplate(meta)).compile()
         meta_block_text = (BlockTextTemplate(meta_text, 'info', self.character_set, min_length=100)).compile()
-        return meta_block_text + '\n\n' + text + '\n'
+        handle.write(meta_block_text + '\n\n')
+        writer = ConstrainedWidthTextWriter(handle, 100)
+        for text in self.result.get_texts():
+            writer.write(text)
+        writer.close()
+        handle.write('\n')
 
 
 class BlockTextTemplate:
@@ -123,11 +138,47 @@ class ConstrainedWidthTextTemplate:
         self.max_width = max_width
 
     def compile(self):
-        parts = self.text.split(' ')
-        lines = [parts.pop(0)]
+        handle = io.StringIO()
+        writer = ConstrainedWidthTextWriter(handle, self.max_width)
+        writer.write(self.text)
+        writer.close()
+        return handle.getvalue()
+
+
+class ConstrainedWidthTextWriter:
+    def __init__(self, handle, max_width):
+        """
+        Wraps text, which is passed in pieces, and writes it to a file handle line by line. Words
+        are appended to the current line as long as the line is at most `max_width` characters
+        long before the word is appended; only the current word is kept in memory.
+        :param handle: Writable text file handle
+        :param int max_width:
+        """
+        self.handle = handle
+        self.max_width = max_width
+        # The (incomplete) word at the end of the text so far
+        self.word = ''
+        # Length of the current line, or None if nothing has been written yet
+        self.line_length = None
+
+    def write(self, text):
+        parts = text.split(' ')
+        parts[0] = self.word + parts[0]
+        self.word = parts.pop()
         for part in parts:
-            if len(lines[-1]) + len(part) <= self.max_width:
-                lines[-1] += f' {part}'
-            else:
-                lines.append(part)
-        return '\n'.join(lines)
\ No newline at end of file
+            self.write_word(part)
+
+    def write_word(self, word):
+        if self.line_length is None:
+            self.handle.write(word)
+            self.line_length = len(word)
+        elif self.line_length + len(word) <= self.max_width:
+            self.handle.write(f' {word}')
+            self.line_length += len(word) + 1
+        else:
+            self.handle.write(f'\n{word}')
+            self.line_length = len(word)
+
+    def close(self):
+        self.write_word(self.word)
+        self.word = ''
\ No newline at end of file
@@ -0,0 +1,107 @@
+from array import array
+
+import numpy as np
+
+
+class Timeline:
+    def __init__(self):
+        """
+        An ordered plan of the output: which segment starts at which offset. All offsets and
+        lengths are integer milliseconds, the same unit pydub uses for the length of audio.
+        Parts of the timeline that are not covered by an entry (e.g. breath pauses) are silent.
+
+        The entries are stored in columns: the index of the segment (every distinct segment is
+        only stored once, in the order in which they first appear) and the start offset.
+        """
+        self.segments = []
+        self.segment_index_map = {}
+        self.segment_indices = array('i')
+        self.starts = array('q')
+        self.duration = 0
+
+    @staticmethod
+    def from_columns(segments, segment_indices, starts, duration):
+        """
+        :param list segments: The distinct segments
+        :param list segment_indices: Index (in segments) of the segment of each entry
+        :param list starts: Start offset of each entry in milliseconds
+        :param int duration: Length of the timeline in milliseconds
+        :rtype: Timeline
+        """
+        timeline = Timeline()
+        for segment in segments:
+            timeline.intern(segment)
+        timeline.segment_indices = array('i', segment_indices)
+        timeline.starts = array('q', starts)
+        timeline.duration = duration
+        return timeline
+
+    def intern(self, segment):
+        """
+        :param Segment segment:
+        :return: The index of the segment in self.segments
+        :rtype: int
+        """
+        key = id(segment)
+        if key not in self.segment_index_map:
+            self.segment_index_map[key] = len(self.segments)
+            self.segments.append(segment)
+        return self.segment_index_map[key]
+
+    def append(self, segment):
+        """
+        Places a segment at the current end of the timeline
+        :param Segment segment:
+        """
+        self.segment_indices.append(self.intern(segment))
+        self.starts.append(self.duration)
+        self.duration += segment.duration
+
+    def skip(self, length):
+        """
+        Leaves a silent gap at the current end of the timeline
+        :param int length: Length of the gap in milliseconds
+        """
+        self.duration += length
+
+    def get_segment_indices(self):
+        """
+        :rtype: np.ndarray
+        """
+        return np.frombuffer(self.segment_indices, dtype=np.intc)
+
+    def get_starts(self):
+        """
+        :return: The start offsets in milliseconds
+        :rtype: np.ndarray
+        """
+        return np.frombuffer(self.starts, dtype=np.int64)
+
+    def get_counts(self):
+        """
+        :return: The number of times each segment (by index) occurs
+        :rtype: np.ndarray
+        """
+        return np.bincount(self.get_segment_indices(), minlength=len(self.segments))
+
+    def export(self, path):
+        """
+        Writes the timeline to a compressed .npz file, for analysis outside of this program
+        :param str path:
+        """
+        np.savez_compressed(
+            path,
+            segment_indices=self.get_segment_indices(),
+            starts=self.get_starts(),
+            duration=np.array(self.duration),
+            segment_ids=np.array([str(segment.id) for segment in self.segments]),
+            segment_texts=np.array([segment.text for segment in self.segments]),
+            segment_durations=np.array([segment.duration for segment in self.segments], dtype=np.int64)
+        )
+
+    def __iter__(self):
+        for index, start in zip(self.segment_indices, self.starts):
+            yield self.segments[index], start
+
+    def __len__(self):
+        return len(self.segment_indices)
@@ -4,17 +4,11 @@ def extract(key, store, _else=None):
 
 
 def lpad_string(string, padding_character, padding):
-    result = ''
-    for _ in range(padding):
-        result += padding_character
-    return result + string
+    return padding_character * padding + string
 
 
 def rpad_string(string, padding_character, padding):
-    result = string
-    for _ in range(padding):
-        result += padding_character
-    return result
+    return string + padding_character * padding
 
 
 def lrpad_string(string, padding_character, padding):
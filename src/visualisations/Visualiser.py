@@ -1,29 +1,85 @@
 import matplotlib.pyplot as plt
 import numpy as np
+from matplotlib.figure import Figure
 
 
 class Visualiser:
     def __init__(self, result):
         self.result = result
 
+    def get_id_groups(self):
+        """
+        :return: The ids of the picked segments, in the order in which they were first picked, and
+                 for each of them the indices of the segments in the timeline that have that id
+        """
+        id_index_map = {}
+        for index, segment in enumerate(self.result.timeline.segments):
+            indices = id_index_map.get(segment.id, [])
+            indices.append(index)
+            id_index_map[segment.id] = indices
+        return list(id_index_map.keys()), list(id_index_map.values())
+
     def show_visualisation(self):
-        id_segment_map = {}
-        for entry in self.result.segment_timestamp_map:
-            segment = entry['segment']
-            segment_list = id_segment_map.get(segment.id, [])
-            segment_list.append(entry)
-            id_segment_map[segment.id] = segment_list
+        timeline = self.result.timeline
+        timestamps = timeline.get_starts() / 1000
 
+        # Group the timestamps by segment (a stable sort keeps them in order of time) and then by
+        # segment id
+        order = np.argsort(timeline.get_segment_indices(), kind='stable')
+        groups = np.split(timestamps[order], np.cumsum(timeline.get_counts())[:-1])
+        labels, id_groups = self.get_id_groups()
         timestamp_data = []
-        labels = []
-        for segment_id, entries in id_segment_map.items():
-            segment_timestamp_data = []
-            for entry in entries:
-                timestamp = entry['timestamp']
-                segment_timestamp_data.append(timestamp)
-            timestamp_data.append(segment_timestamp_data)
-            labels.append(segment_id)
+        for indices in id_groups:
+            timestamp_data.append(np.sort(np.concatenate([groups[index] for index in indices])))
 
         plt.eventplot(timestamp_data, colors=np.random.rand(len(timestamp_data), 3))
         plt.legend(labels)
         plt.show()
+
+    def get_density(self, buckets):
+        """
+        Counts the picks of each segment id per time bucket
+        :param int buckets: Number of (equally long) time buckets
+        :return: Array with shape (ids, buckets)
+        :rtype: np.ndarray
+        """
+        timeline = self.result.timeline
+        labels, id_groups = self.get_id_groups()
+        id_indices = np.zeros(len(timeline.segments), dtype=np.int64)
+        for row, indices in enumerate(id_groups):
+            id_indices[indices] = row
+
+        duration = max(timeline.duration, 1)
+        bucket_indices = np.minimum(timeline.get_starts() * buckets // duration, buckets - 1)
+        cells = id_indices[timeline.get_segment_indices()] * buckets + bucket_indices
+        return np.bincount(cells, minlength=len(labels) * buckets).reshape(len(labels), buckets)
+
+    def save_density(self, path, buckets=500, max_labels=50):
+        """
+        Draws a heatmap of the number of picks of each segment over time and writes it to a file.
+        The events are binned first, so drawing only depends on the number of buckets. No display
+        is needed, which makes this usable on headless machines.
+        :param str path: Location of the image, the extension (e.g. .png or .svg) sets the format
+        :param int buckets: Number of time buckets
+        :param int max_labels: Segment ids are only shown if there are at most this many
+        """
+        labels, _ = self.get_id_groups()
+        density = self.get_density(buckets)
+        duration = self.result.get_duration_in_seconds()
+
+        figure = Figure(figsize=(12, max(3, min(len(labels), max_labels) * 0.25 + 1)))
+        axes = figure.add_subplot()
+        image = axes.imshow(
+            density,
+            aspect='auto',
+            interpolation='nearest',
+            cmap='viridis',
+            extent=(0, duration, len(labels) - 0.5, -0.5)
+        )
+        if len(labels) <= max_labels:
+            axes.set_yticks(range(len(labels)))
+            axes.set_yticklabels(labels)
+        axes.set_xlabel('Time (s)')
+        axes.set_ylabel('Segment')
+        figure.colorbar(image, ax=axes, label='Picks per bucket')
+        figure.savefig(path, bbox_inches='tight')
@@ -0,0 +1,54 @@
+from types import SimpleNamespace
+
+import numpy as np
+from pydub.generators import Sine
+
+from src.cache import LazyAudio
+from src.manifest import load_timeline, read_manifest, write_manifest
+from src.render import Renderer
+from src.segment import Segment
+from src.settings import Settings
+from src.timeline import Timeline
+
+
+class DecodingCache:
+    """
+    Stands in for an AudioCache that decodes a clip to another length than was probed from it
+    """
+    def __init__(self, audio):
+        self.audio = audio
+
+    def load(self, path, audio_format=None):
+        return self.audio
+
+
+def plan(audio_cache, probed_duration):
+    segment = Segment('a', 'a', '. ', LazyAudio(audio_cache, 'audio/a.mp3', probed_duration), None, [], [], 'a.mp3')
+    timeline = Timeline()
+    timeline.append(segment)
+    timeline.skip(100)
+    timeline.append(segment)
+    return SimpleNamespace(result=SimpleNamespace(timeline=timeline), settings=Settings(1, 3, 100), effects=[])
+
+
+def round_trip(tmp_path, decoded_duration, probed_duration):
+    audio_cache = DecodingCache(Sine(440, sample_rate=8000).to_audio_segment(decoded_duration))
+    task = plan(audio_cache, probed_duration)
+    write_manifest(str(tmp_path / 'plan.manifest.json'), task, str(tmp_path))
+    timeline = load_timeline(read_manifest(str(tmp_path / 'plan.manifest.json')), 'audio', audio_cache)
+    return task.result.timeline, timeline
+
+
+def test_decoded_audio_is_trimmed_to_the_planned_duration(tmp_path):
+    planned, loaded = round_trip(tmp_path, 1237, 1200)
+    assert loaded.segments[0].duration == 1200
+    assert len(loaded.segments[0].audio) == 1200
+    assert loaded.get_starts().tolist() == [0, 1300]
+    assert np.array_equal(Renderer(loaded).render(), Renderer(planned).render())
+
+
+def test_decoded_audio_is_padded_to_the_planned_duration(tmp_path):
+    planned, loaded = round_trip(tmp_path, 1180, 1200)
+    assert loaded.segments[0].duration == 1200
+    assert len(loaded.segments[0].audio) == 1200
+    assert np.array_equal(Renderer(loaded).render(), Renderer(planned).render())
@@ -0,0 +1,96 @@
+import pytest
+from pydub.exceptions import CouldntEncodeError
+
+from src.sinks import (
+    MP3_ENCODER_DELAY, MP3_TAG_SIZE, crc16, get_gapless_header, parse_mp3_header, split_mp3_frames
+)
+
+# MPEG-1 layer III without CRC, 128 kbit/s at 44.1 kHz, stereo
+MPEG1_HEADER = 0xFFFB9000
+# MPEG-2 layer III without CRC, 64 kbit/s at 22.05 kHz, stereo
+MPEG2_HEADER = 0xFFF38000
+PADDING_BIT = 1 << 9
+MONO = 3 << 6
+
+
+def build_frame(header):
+    length, _, _ = parse_mp3_header(header)
+    return header.to_bytes(4, 'big') + bytes(length - 4)
+
+
+def test_crc16_is_crc16_arc():
+    assert crc16(b'123456789') == 0xBB3D
+    assert crc16(b'56789', crc16(b'1234')) == 0xBB3D
+
+
+def test_mpeg1_frame_length():
+    # 1152 / 8 * 128000 / 44100 = 417.96 bytes, rounded down
+    assert parse_mp3_header(MPEG1_HEADER) == (417, 1152, 32)
+
+
+def test_mpeg1_frame_length_with_padding():
+    assert parse_mp3_header(MPEG1_HEADER | PADDING_BIT) == (418, 1152, 32)
+
+
+def test_mpeg1_mono_side_info():
+    assert parse_mp3_header(MPEG1_HEADER | MONO) == (417, 1152, 17)
+
+
+def test_mpeg2_frame_length():
+    # 576 / 8 * 64000 / 22050 = 208.98 bytes, rounded down
+    assert parse_mp3_header(MPEG2_HEADER) == (208, 576, 17)
+
+
+def test_invalid_header():
+    with pytest.raises(CouldntEncodeError):
+        parse_mp3_header(0x12345678)
+    # Layer I instead of layer III
+    with pytest.raises(CouldntEncodeError):
+        parse_mp3_header(0xFFFF9000)
+
+
+def test_split_frames_of_varying_length():
+    frames = [build_frame(MPEG1_HEADER), build_frame(MPEG1_HEADER | PADDING_BIT), build_frame(MPEG1_HEADER)]
+    assert [len(frame) for frame in split_mp3_frames(b''.join(frames))] == [417, 418, 417]
+    assert split_mp3_frames(b''.join(frames)) == frames
+
+
+def test_gapless_header():
+    first_frame = build_frame(MPEG1_HEADER | PADDING_BIT)
+    frame_count = 10
+    byte_count = 4175
+    sample_count = frame_count * 1152 - MP3_ENCODER_DELAY - 100
+    frame = get_gapless_header(first_frame, frame_count, byte_count, sample_count)
+
+    header = int.from_bytes(frame[:4], 'big')
+    length, _, side_info = parse_mp3_header(header)
+    assert length == len(frame)
+    assert length >= 4 + side_info + MP3_TAG_SIZE
+    assert header & PADDING_BIT == 0
+    # Same version, layer, sample rate and channel mode as the audio frames
+    assert header & 0xFFFE0CC0 == MPEG1_HEADER & 0xFFFE0CC0
+
+    xing = 4 + side_info
+    assert frame[xing:xing + 4] == b'Info'
+    assert int.from_bytes(frame[xing + 4:xing + 8], 'big') == 0xF
+    assert int.from_bytes(frame[xing + 8:xing + 12], 'big') == frame_count
+    assert int.from_bytes(frame[xing + 12:xing + 16], 'big') == byte_count + length
+
+    lame = xing + 120
+    assert frame[lame:lame + 9] == b'LAME3.100'
+    delay_padding = int.from_bytes(frame[lame + 21:lame + 24], 'big')
+    assert delay_padding >> 12 == MP3_ENCODER_DELAY
+    assert delay_padding & 0xFFF == 100
+    assert int.from_bytes(frame[lame + 28:lame + 32], 'big') == byte_count + length
+    # The tag ends with a CRC of the frame up to it
+    assert int.from_bytes(frame[lame + 34:lame + 36], 'big') == crc16(frame[:lame + 34])
+    assert lame + 36 == xing + MP3_TAG_SIZE
+
+
+def test_gapless_header_of_mpeg2_stream():
+    frame = get_gapless_header(build_frame(MPEG2_HEADER | MONO), 4, 800, 4 * 576 - MP3_ENCODER_DELAY)
+    length, samples, side_info = parse_mp3_header(int.from_bytes(frame[:4], 'big'))
+    assert (length, samples, side_info) == (len(frame), 576, 9)
+    lame = 4 + side_info + 120
+    assert int.from_bytes(frame[lame + 21:lame + 24], 'big') == MP3_ENCODER_DELAY << 12
+    assert int.from_bytes(frame[lame + 34:lame + 36], 'big') == crc16(frame[:lame + 34])